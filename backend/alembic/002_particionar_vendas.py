@@ -0,0 +1,167 @@
+"""Particiona tabela vendas por data_venda (mensal)
+
+Com pg_partman (4.x ou 5.x), todas as partições (inclusive vendas_default)
+são criadas pelo próprio partman a partir de INICIO_PARTICOES e as futuras
+pela sua manutenção. Sem ele, a migration cria vendas_YYYY_MM apenas até
+MESES_FUTUROS meses após a migração; vendas posteriores vão para
+vendas_default até que novas partições sejam criadas (nova migration).
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-15 00:00:00.000000
+
+"""
+from datetime import date
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+# Primeiro mês com partição dedicada; linhas anteriores caem na partição default
+INICIO_PARTICOES = date(2024, 1, 1)
+# Quantos meses à frente criar partições quando o pg_partman não está disponível
+MESES_FUTUROS = 12
+
+
+def _proximo_mes(d: date) -> date:
+    return date(d.year + (d.month // 12), d.month % 12 + 1, 1)
+
+
+def _meses_particao():
+    """Gera o início de cada mês entre INICIO_PARTICOES e hoje + MESES_FUTUROS."""
+    hoje = date.today().replace(day=1)
+    fim = hoje
+    for _ in range(MESES_FUTUROS):
+        fim = _proximo_mes(fim)
+
+    mes = INICIO_PARTICOES
+    while mes <= fim:
+        yield mes
+        mes = _proximo_mes(mes)
+
+
+def upgrade() -> None:
+    # Tabelas particionadas não podem ser referenciadas por FK apenas em "id"
+    # (a chave única precisa incluir data_venda)
+    op.execute("ALTER TABLE produtos_vendas DROP CONSTRAINT IF EXISTS produtos_vendas_venda_id_fkey")
+
+    # Move a tabela atual para o lado e libera os nomes de índices/sequência
+    op.execute("ALTER TABLE vendas RENAME TO vendas_legado")
+    op.execute("ALTER TABLE vendas_legado RENAME CONSTRAINT vendas_pkey TO vendas_legado_pkey")
+    op.execute("ALTER INDEX IF EXISTS ix_vendas_id RENAME TO ix_vendas_legado_id")
+    op.execute("ALTER INDEX IF EXISTS ix_vendas_data_venda RENAME TO ix_vendas_legado_data_venda")
+    op.execute("ALTER INDEX IF EXISTS idx_gin_vendas_cidade RENAME TO idx_gin_vendas_legado_cidade")
+    op.execute("ALTER SEQUENCE vendas_id_seq OWNED BY NONE")
+
+    # Tabela particionada; a chave primária precisa conter a chave de partição
+    op.execute("""
+        CREATE TABLE vendas (
+            LIKE vendas_legado INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+            PRIMARY KEY (id, data_venda)
+        ) PARTITION BY RANGE (data_venda)
+    """)
+    op.execute("ALTER SEQUENCE vendas_id_seq OWNED BY vendas.id")
+    # LIKE não copia chaves estrangeiras; tabelas particionadas podem
+    # referenciar tabelas comuns
+    op.execute("""
+        ALTER TABLE vendas
+        ADD CONSTRAINT vendas_user_id_fkey
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    """)
+
+    # Partições mensais: com pg_partman instalado ele cria todas (os nomes
+    # dele, vendas_pYYYYMMDD, sobreporiam partições criadas à mão); sem ele,
+    # cria-se vendas_YYYY_MM até MESES_FUTUROS meses à frente. A assinatura
+    # de create_parent mudou na 5.x (sem p_type 'native' e intervalo como
+    # interval); nas duas versões o partman cria vendas_default
+    particoes_manuais = "\n                ".join(
+        f"CREATE TABLE IF NOT EXISTS vendas_{inicio:%Y_%m} PARTITION OF vendas "
+        f"FOR VALUES FROM ('{inicio:%Y-%m-%d}') TO ('{_proximo_mes(inicio):%Y-%m-%d}');"
+        for inicio in _meses_particao()
+    )
+    op.execute(f"""
+        DO $$
+        DECLARE versao_partman text;
+        BEGIN
+            SELECT extversion INTO versao_partman
+            FROM pg_extension WHERE extname = 'pg_partman';
+
+            IF versao_partman IS NULL THEN
+                RAISE NOTICE 'pg_partman ausente: partições de vendas só até {MESES_FUTUROS} meses à frente';
+                {particoes_manuais}
+                CREATE TABLE IF NOT EXISTS vendas_default PARTITION OF vendas DEFAULT;
+            ELSIF split_part(versao_partman, '.', 1)::int >= 5 THEN
+                PERFORM partman.create_parent(
+                    p_parent_table := 'public.vendas',
+                    p_control := 'data_venda',
+                    p_interval := '1 month',
+                    p_premake := 3,
+                    p_start_partition := '{INICIO_PARTICOES:%Y-%m-%d}'
+                );
+            ELSE
+                PERFORM partman.create_parent(
+                    p_parent_table := 'public.vendas',
+                    p_control := 'data_venda',
+                    p_type := 'native',
+                    p_interval := 'monthly',
+                    p_premake := 3,
+                    p_start_partition := '{INICIO_PARTICOES:%Y-%m-%d}'
+                );
+            END IF;
+        END $$;
+    """)
+
+    # Índices no pai são propagados para cada partição
+    op.execute("CREATE INDEX ix_vendas_id ON vendas (id)")
+    op.execute("CREATE INDEX ix_vendas_data_venda ON vendas (data_venda)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_gin_vendas_cidade ON vendas USING gin (cidade gin_trgm_ops)")
+
+    # Copia os dados e remove a tabela antiga
+    op.execute("INSERT INTO vendas SELECT * FROM vendas_legado")
+    op.execute("DROP TABLE vendas_legado")
+
+
+def downgrade() -> None:
+    op.execute("""
+        DO $$ BEGIN
+            IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_partman') THEN
+                DELETE FROM partman.part_config WHERE parent_table = 'public.vendas';
+                DROP TABLE IF EXISTS partman.template_public_vendas;
+            END IF;
+        END $$;
+    """)
+
+    op.execute("ALTER TABLE vendas RENAME TO vendas_particionada")
+    op.execute("ALTER SEQUENCE vendas_id_seq OWNED BY NONE")
+    op.execute("ALTER INDEX IF EXISTS ix_vendas_id RENAME TO ix_vendas_particionada_id")
+    op.execute("ALTER INDEX IF EXISTS ix_vendas_data_venda RENAME TO ix_vendas_particionada_data_venda")
+    op.execute("ALTER INDEX IF EXISTS idx_gin_vendas_cidade RENAME TO idx_gin_vendas_particionada_cidade")
+
+    op.execute("""
+        CREATE TABLE vendas (
+            LIKE vendas_particionada INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+            PRIMARY KEY (id)
+        )
+    """)
+    op.execute("ALTER SEQUENCE vendas_id_seq OWNED BY vendas.id")
+    op.execute("""
+        ALTER TABLE vendas
+        ADD CONSTRAINT vendas_user_id_fkey
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    """)
+    op.execute("CREATE INDEX ix_vendas_id ON vendas (id)")
+    op.execute("CREATE INDEX ix_vendas_data_venda ON vendas (data_venda)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_gin_vendas_cidade ON vendas USING gin (cidade gin_trgm_ops)")
+
+    op.execute("INSERT INTO vendas SELECT * FROM vendas_particionada")
+    op.execute("DROP TABLE vendas_particionada CASCADE")
+
+    op.execute("""
+        ALTER TABLE produtos_vendas
+        ADD CONSTRAINT produtos_vendas_venda_id_fkey
+        FOREIGN KEY (venda_id) REFERENCES vendas (id)
+    """)
@@ -0,0 +1,79 @@
+"""Fillfactor nas partições de vendas e coluna gerada categoria_id
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-15 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+FILLFACTOR = 90
+
+# Código SMALLINT da categoria, congelado nesta revisão (mesma ordem de
+# CategoriaVenda na época; o enum é persistido pelo nome do membro)
+CODIGO_CATEGORIA_SQL = (
+    "CASE categoria "
+    "WHEN 'BEBIDAS' THEN 1 "
+    "WHEN 'ALIMENTOS' THEN 2 "
+    "WHEN 'VESTUARIO' THEN 3 "
+    "WHEN 'SERVICOS' THEN 4 "
+    "WHEN 'ENERGIA' THEN 5 "
+    "WHEN 'TURISMO' THEN 6 "
+    "WHEN 'AGRICULTURA' THEN 7 "
+    "WHEN 'CONSTRUCAO' THEN 8 "
+    "WHEN 'OUTROS' THEN 9 "
+    "END"
+)
+
+
+def _alterar_particoes(parametro: str) -> None:
+    # Tabelas particionadas não aceitam parâmetros de armazenamento no pai;
+    # aplica em cada partição existente e na tabela template do pg_partman,
+    # de onde as partições futuras herdam o fillfactor. Partições criadas
+    # por migrations devem usar WITH (fillfactor = FILLFACTOR)
+    op.execute(f"""
+        DO $$
+        DECLARE particao regclass;
+        BEGIN
+            FOR particao IN
+                SELECT inhrelid::regclass FROM pg_inherits
+                WHERE inhparent = 'vendas'::regclass
+            LOOP
+                EXECUTE format('ALTER TABLE %s {parametro}', particao);
+            END LOOP;
+
+            IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_partman') THEN
+                FOR particao IN
+                    SELECT template_table::regclass FROM partman.part_config
+                    WHERE parent_table = 'public.vendas' AND template_table IS NOT NULL
+                LOOP
+                    EXECUTE format('ALTER TABLE %s {parametro}', particao);
+                END LOOP;
+            END IF;
+        END $$;
+    """)
+
+
+def upgrade() -> None:
+    # Código SMALLINT da categoria, calculado pelo banco a cada escrita
+    op.execute(f"""
+        ALTER TABLE vendas
+        ADD COLUMN categoria_id SMALLINT
+        GENERATED ALWAYS AS ({CODIGO_CATEGORIA_SQL}) STORED
+    """)
+    op.create_index(op.f('ix_vendas_categoria_id'), 'vendas', ['categoria_id'])
+
+    # Deixa espaço livre nas páginas para updates HOT (processado, variacao_*)
+    _alterar_particoes(f"SET (fillfactor = {FILLFACTOR})")
+
+
+def downgrade() -> None:
+    _alterar_particoes("RESET (fillfactor)")
+    op.drop_index(op.f('ix_vendas_categoria_id'), table_name='vendas')
+    op.drop_column('vendas', 'categoria_id')
@@ -0,0 +1,30 @@
+"""fim_semana passa a ser coluna gerada a partir de dia_semana
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-15 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.drop_column('vendas', 'fim_semana')
+    op.execute("""
+        ALTER TABLE vendas
+        ADD COLUMN fim_semana BOOLEAN
+        GENERATED ALWAYS AS (dia_semana >= 5) STORED
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('vendas', 'fim_semana')
+    op.add_column('vendas', sa.Column('fim_semana', sa.Boolean(), nullable=True))
+    op.execute("UPDATE vendas SET fim_semana = dia_semana >= 5")
@@ -0,0 +1,36 @@
+"""Índice único de previsoes_tempo por local, data e modelo
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-15 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Remove duplicatas antigas (mantém o registro mais antigo)
+    op.execute("""
+        DELETE FROM previsoes_tempo p
+        USING previsoes_tempo d
+        WHERE p.latitude = d.latitude
+        AND p.longitude = d.longitude
+        AND p.data_previsao = d.data_previsao
+        AND p.modelo_previsao = d.modelo_previsao
+        AND p.id > d.id
+    """)
+    op.create_unique_constraint(
+        'uq_previsoes_tempo_local_data_modelo',
+        'previsoes_tempo',
+        ['latitude', 'longitude', 'data_previsao', 'modelo_previsao']
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_previsoes_tempo_local_data_modelo', 'previsoes_tempo', type_='unique')
@@ -0,0 +1,48 @@
+"""Índice único de dados_climaticos por estação/hora; ultima_leitura derivada
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-15 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Remove leituras duplicadas (mantém o registro mais antigo)
+    op.execute("""
+        DELETE FROM dados_climaticos d
+        USING dados_climaticos o
+        WHERE d.estacao_id = o.estacao_id
+        AND d.data_hora = o.data_hora
+        AND d.id > o.id
+    """)
+    op.create_unique_constraint(
+        'uq_dados_climaticos_estacao_data_hora',
+        'dados_climaticos',
+        ['estacao_id', 'data_hora']
+    )
+
+    # Passa a ser calculada com MAX(data_hora) na leitura
+    op.drop_column('estacoes_meteorologicas', 'ultima_leitura')
+
+
+def downgrade() -> None:
+    op.add_column(
+        'estacoes_meteorologicas',
+        sa.Column('ultima_leitura', sa.DateTime(timezone=True), nullable=True)
+    )
+    op.execute("""
+        UPDATE estacoes_meteorologicas e
+        SET ultima_leitura = (
+            SELECT MAX(d.data_hora) FROM dados_climaticos d WHERE d.estacao_id = e.id
+        )
+    """)
+    op.drop_constraint('uq_dados_climaticos_estacao_data_hora', 'dados_climaticos', type_='unique')
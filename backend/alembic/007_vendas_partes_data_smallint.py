@@ -0,0 +1,41 @@
+"""Partes da data em vendas (ano, mes, dia, dia_semana, hora) como SMALLINT
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-15 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+COLUNAS = ['ano', 'mes', 'dia', 'dia_semana', 'hora']
+
+
+def _alterar_tipo(tipo: str) -> None:
+    # fim_semana é gerada a partir de dia_semana e impede a troca de tipo;
+    # é removida e recriada em volta do ALTER
+    op.execute("ALTER TABLE vendas DROP COLUMN fim_semana")
+
+    # Um único ALTER no pai particionado (propagado às partições), com uma
+    # só reescrita da tabela
+    alteracoes = ", ".join(f"ALTER COLUMN {coluna} TYPE {tipo}" for coluna in COLUNAS)
+    op.execute(f"ALTER TABLE vendas {alteracoes}")
+
+    op.execute("""
+        ALTER TABLE vendas
+        ADD COLUMN fim_semana BOOLEAN
+        GENERATED ALWAYS AS (dia_semana >= 5) STORED
+    """)
+
+
+def upgrade() -> None:
+    _alterar_tipo("SMALLINT")
+
+
+def downgrade() -> None:
+    _alterar_tipo("INTEGER")
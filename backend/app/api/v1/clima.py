@@ -1,5 +1,6 @@
 # Endpoints de clima
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, timedelta
@@ -16,7 +17,9 @@ from app.schemas.clima import (
 )
 from app.models.clima import EstacaoMeteorologica, DadoClimatico
 
-router = APIRouter()
+# Respostas serializadas com orjson; o response_model de cada rota continua
+# validando e filtrando os campos
+router = APIRouter(default_response_class=ORJSONResponse)
 
 @router.get("/estacoes", response_model=List[EstacaoResponse])
 async def listar_estacoes(
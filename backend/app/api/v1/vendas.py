@@ -57,7 +57,6 @@ async def criar_venda(
         estado=venda.estado,
         regiao=venda.regiao,
         feriado=venda.feriado or False,
-        fim_semana=venda.data_venda.weekday() >= 5,
         evento_especial=venda.evento_especial,
         fonte_dados=venda.fonte_dados or "manual"
     )
@@ -109,7 +108,6 @@ async def criar_vendas_lote(
                 estado=venda.estado,
                 regiao=venda.regiao,
                 feriado=venda.feriado or False,
-                fim_semana=venda.data_venda.weekday() >= 5,
                 evento_especial=venda.evento_especial,
                 fonte_dados=vendas_data.fonte_dados or "importacao"
             )
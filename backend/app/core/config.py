@@ -37,6 +37,7 @@ class Settings(BaseSettings):
     REDIS_PASSWORD: Optional[str] = os.getenv("REDIS_PASSWORD", None)
     REDIS_DB: int = int(os.getenv("REDIS_DB", "0"))
     CACHE_TTL: int = 3600  # 1 hora padrão
+    CACHE_ENABLED: bool = True  # False desliga o cache (ex.: testes de carga)
     
     # APIs Externas
     INMET_API_KEY: Optional[str] = os.getenv("INMET_API_KEY", None)
@@ -48,6 +49,7 @@ class Settings(BaseSettings):
     MODEL_PATH: str = os.getenv("MODEL_PATH", "./models")
     MODEL_UPDATE_INTERVAL: int = 24  # horas
     MIN_TRAINING_SAMPLES: int = 1000
+    ML_MODEL_CACHE_SIZE: int = 100  # modelos mantidos em memória (LRU)
     
     # CORS
     BACKEND_CORS_ORIGINS: List[AnyHttpUrl] = [
@@ -13,6 +13,8 @@ from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
 from app.core.config import settings
 from app.core.database import engine, check_database_connection
 from app.api.v1 import auth, clima, vendas, predicoes, analytics
+from app.services.clima_service import clima_service
+from app.services.cache_service import cache_service
 
 # Configuração de logging
 logging.basicConfig(
@@ -48,7 +50,8 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Encerrando aplicação...")
-    # Aqui você pode adicionar limpeza de recursos
+    await clima_service.fechar()
+    await cache_service.fechar()
 
 # Criação da aplicação FastAPI
 app = FastAPI(
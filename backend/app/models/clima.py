@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, Float, DateTime, Integer, JSON, Boolean, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Float, DateTime, Integer, JSON, Boolean, Text, ForeignKey, UniqueConstraint, select
+from sqlalchemy.orm import relationship, column_property
 from geoalchemy2 import Geometry
 from sqlalchemy.sql import func
 import enum
@@ -31,7 +31,7 @@ class EstacaoMeteorologica(BaseModel):
     # Status
     ativa = Column(Boolean, default=True)  # Corrigido de Integer para Boolean
     data_instalacao = Column(DateTime(timezone=True), nullable=True)
-    ultima_leitura = Column(DateTime(timezone=True), nullable=True)
+    # ultima_leitura: derivada de dados_climaticos (definida após DadoClimatico)
     
     # Relacionamentos
     dados_climaticos = relationship("DadoClimatico", back_populates="estacao", cascade="all, delete-orphan")
@@ -41,6 +41,10 @@ class DadoClimatico(BaseModel):
     Modelo para dados climáticos coletados.
     """
     __tablename__ = "dados_climaticos"
+    __table_args__ = (
+        # Uma leitura por estação/hora (alvo do ON CONFLICT ao salvar)
+        UniqueConstraint('estacao_id', 'data_hora', name='uq_dados_climaticos_estacao_data_hora'),
+    )
     
     # Relacionamento
     estacao_id = Column(Integer, ForeignKey("estacoes_meteorologicas.id"), nullable=False)
@@ -87,11 +91,28 @@ class DadoClimatico(BaseModel):
     qualidade = Column(JSON, nullable=True)  # flags de qualidade
     fonte = Column(String(50), default="INMET")
 
+# Última leitura calculada a partir dos dados gravados (usa o índice único
+# estacao_id/data_hora); carregada apenas quando acessada
+EstacaoMeteorologica.ultima_leitura = column_property(
+    select(func.max(DadoClimatico.data_hora))
+    .where(DadoClimatico.estacao_id == EstacaoMeteorologica.id)
+    .correlate_except(DadoClimatico)
+    .scalar_subquery(),
+    deferred=True
+)
+
 class PrevisaoTempo(BaseModel):
     """
     Modelo para previsões do tempo.
     """
     __tablename__ = "previsoes_tempo"
+    __table_args__ = (
+        # Uma previsão por local/data/modelo (alvo do ON CONFLICT ao salvar)
+        UniqueConstraint(
+            'latitude', 'longitude', 'data_previsao', 'modelo_previsao',
+            name='uq_previsoes_tempo_local_data_modelo'
+        ),
+    )
     
     # Localização
     latitude = Column(Float, nullable=False)
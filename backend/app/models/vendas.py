@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, DateTime, Integer, JSON, ForeignKey, Enum, Boolean
+from sqlalchemy import Column, String, Float, DateTime, Integer, SmallInteger, JSON, ForeignKey, Enum, Boolean, Computed
 from sqlalchemy.orm import relationship
 from decimal import Decimal
 import enum
@@ -17,6 +17,19 @@ class CategoriaVenda(str, enum.Enum):
     CONSTRUCAO = "construcao"
     OUTROS = "outros"
 
+def _codigo_categoria_sql() -> str:
+    """
+    Expressão SQL que mapeia a categoria (enum) para um código SMALLINT.
+    
+    O enum é persistido pelo nome do membro; os códigos seguem a ordem de
+    declaração em CategoriaVenda, então novas categorias devem ir ao final.
+    """
+    casos = " ".join(
+        f"WHEN '{categoria.name}' THEN {codigo}"
+        for codigo, categoria in enumerate(CategoriaVenda, start=1)
+    )
+    return f"CASE categoria {casos} END"
+
 class CanalVenda(str, enum.Enum):
     """Canais de venda."""
     LOJA_FISICA = "loja_fisica"
@@ -28,6 +41,9 @@ class CanalVenda(str, enum.Enum):
 class Venda(BaseModel):
     """
     Modelo para registro de vendas.
+    
+    Em PostgreSQL a tabela é particionada mensalmente por data_venda
+    (migration 002); os índices declarados aqui são criados por partição.
     """
     __tablename__ = "vendas"
     
@@ -37,11 +53,11 @@ class Venda(BaseModel):
     
     # Dados temporais
     data_venda = Column(DateTime(timezone=True), nullable=False, index=True)
-    ano = Column(Integer, nullable=False)
-    mes = Column(Integer, nullable=False)
-    dia = Column(Integer, nullable=False)
-    dia_semana = Column(Integer, nullable=False)  # 0 = segunda, 6 = domingo
-    hora = Column(Integer, nullable=True)
+    ano = Column(SmallInteger, nullable=False)
+    mes = Column(SmallInteger, nullable=False)
+    dia = Column(SmallInteger, nullable=False)
+    dia_semana = Column(SmallInteger, nullable=False)  # 0 = segunda, 6 = domingo
+    hora = Column(SmallInteger, nullable=True)
     
     # Valores
     valor_total = Column(Float, nullable=False)
@@ -51,6 +67,7 @@ class Venda(BaseModel):
     
     # Categorização
     categoria = Column(Enum(CategoriaVenda), nullable=False)
+    categoria_id = Column(SmallInteger, Computed(_codigo_categoria_sql(), persisted=True), index=True)
     subcategoria = Column(String(100), nullable=True)
     canal = Column(Enum(CanalVenda), nullable=False)
     
@@ -73,7 +90,7 @@ class Venda(BaseModel):
     
     # Flags
     feriado = Column(Boolean, default=False)
-    fim_semana = Column(Boolean, default=False)
+    fim_semana = Column(Boolean, Computed("dia_semana >= 5", persisted=True))
     evento_especial = Column(String(100), nullable=True)
     
     # Metadados
@@ -82,7 +99,12 @@ class Venda(BaseModel):
     anomalia = Column(Boolean, default=False)
     
     # Relacionamentos
-    produtos = relationship("ProdutoVenda", back_populates="venda", cascade="all, delete-orphan")
+    produtos = relationship(
+        "ProdutoVenda",
+        primaryjoin="Venda.id == foreign(ProdutoVenda.venda_id)",
+        back_populates="venda",
+        cascade="all, delete-orphan"
+    )
 
 class MetaVenda(BaseModel):
     """
@@ -114,9 +136,14 @@ class ProdutoVenda(BaseModel):
     """
     __tablename__ = "produtos_vendas"
     
-    # Relacionamento com venda
-    venda_id = Column(Integer, ForeignKey("vendas.id"), nullable=False)
-    venda = relationship("Venda", back_populates="produtos")
+    # Relacionamento com venda. Sem FK no banco: a chave de vendas
+    # particionada é (id, data_venda) (migration 002)
+    venda_id = Column(Integer, nullable=False)
+    venda = relationship(
+        "Venda",
+        primaryjoin="Venda.id == foreign(ProdutoVenda.venda_id)",
+        back_populates="produtos"
+    )
     
     # Dados do produto
     codigo_produto = Column(String(50), nullable=False)
@@ -1,24 +1,91 @@
 import redis
 import json
+import orjson
+import msgpack
 import pickle
-from typing import Optional, Any, Union
-from datetime import timedelta
-import hashlib
+from typing import Optional, Any, Iterator, List, Tuple, Dict
+from datetime import date, datetime, timedelta
+import xxhash
 import logging
-from functools import wraps
+from functools import wraps, lru_cache
 import asyncio
+import inspect
 
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+def _congelar(valor: Any) -> Any:
+    """
+    Converte dicts/listas em tuplas ordenadas, tornando o valor hasheável
+    e com serialização determinística.
+    
+    Números levam o tipo junto: 1, 1.0 e True são iguais como chave do
+    lru_cache de _hash_key e receberiam o mesmo digest.
+    """
+    if isinstance(valor, dict):
+        return tuple(sorted(
+            ((_congelar(k), _congelar(v)) for k, v in valor.items()),
+            key=lambda item: str(item[0])
+        ))
+    if isinstance(valor, (list, tuple)):
+        return tuple(_congelar(v) for v in valor)
+    if isinstance(valor, (bool, int, float)):
+        return (type(valor).__name__, valor)
+    return valor
+
+# Falhas do fallback em pickle (objetos não serializáveis, ex.: lambdas,
+# conexões); tratadas como erro de cache, nunca propagadas ao chamador
+_ERROS_SERIALIZACAO = (pickle.PicklingError, TypeError, AttributeError)
+
+# Códigos de ExtType usados nos payloads msgpack
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+
+def _msgpack_default(valor: Any) -> msgpack.ExtType:
+    """Codifica tipos sem representação nativa em msgpack."""
+    if isinstance(valor, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, valor.isoformat().encode())
+    if isinstance(valor, date):
+        return msgpack.ExtType(_EXT_DATE, valor.isoformat().encode())
+    raise TypeError(f"Tipo não suportado pelo msgpack: {type(valor).__name__}")
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    """Decodifica os ExtType gravados por _msgpack_default."""
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == _EXT_DATE:
+        return date.fromisoformat(data.decode())
+    return msgpack.ExtType(code, data)
+
 class CacheService:
     """
     Serviço de cache usando Redis para otimizar performance.
     """
     
+    # Lê a chave e, se ausente, grava o valor com TTL numa única ida ao Redis.
+    # Retorna o valor existente, ou nil quando o valor novo foi gravado.
+    _GET_OR_SET_SCRIPT = """
+    local atual = redis.call('GET', KEYS[1])
+    if atual then
+        return atual
+    end
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+    return false
+    """
+    
     def __init__(self):
         self.redis_client = None
+        self._get = None
+        self._set = None
+        self._setex = None
+        self._get_or_set_script = None
+        
+        # Fila de escritas em segundo plano (criada no primeiro uso, por event loop)
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._write_flusher_task: Optional[asyncio.Task] = None
+        self._write_loop: Optional[asyncio.AbstractEventLoop] = None
+        
         self._connect()
     
     def _connect(self):
@@ -37,6 +104,12 @@ class CacheService:
             )
             # Testa conexão
             self.redis_client.ping()
+            
+            # Métodos usados nos caminhos quentes, resolvidos uma única vez
+            self._get = self.redis_client.get
+            self._set = self.redis_client.set
+            self._setex = self.redis_client.setex
+            self._get_or_set_script = self.redis_client.register_script(self._GET_OR_SET_SCRIPT)
             logger.info("Conexão com Redis estabelecida com sucesso")
         except Exception as e:
             logger.error(f"Erro ao conectar com Redis: {e}")
@@ -45,10 +118,26 @@ class CacheService:
     def _generate_key(self, prefix: str, params: dict) -> str:
         """
         Gera chave única baseada em prefixo e parâmetros.
+        
+        O hash (xxh3 de 128 bits) não é criptográfico: serve apenas para
+        distribuir e identificar chaves de cache.
         """
         # Ordena os parâmetros para garantir consistência
-        sorted_params = json.dumps(params, sort_keys=True)
-        hash_params = hashlib.md5(sorted_params.encode()).hexdigest()
+        items = _congelar(params)
+        try:
+            return self._hash_key(prefix, items)
+        except TypeError:
+            # Valor não hasheável ou que o orjson rejeita (sets, objetos
+            # arbitrários; JSONEncodeError é um TypeError): calcula sem
+            # memoização, serializando esses valores pelo repr
+            hash_params = xxhash.xxh3_128(orjson.dumps(items, default=repr)).hexdigest()
+            return f"{prefix}:{hash_params}"
+    
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _hash_key(prefix: str, items: tuple) -> str:
+        """Calcula a chave a partir dos parâmetros já congelados (memoizado)."""
+        hash_params = xxhash.xxh3_128(orjson.dumps(items)).hexdigest()
         return f"{prefix}:{hash_params}"
     
     def get(self, key: str, deserialize: bool = True) -> Optional[Any]:
@@ -63,21 +152,39 @@ class CacheService:
             return None
         
         try:
-            value = self.redis_client.get(key)
-            if value is None:
-                return None
-            
-            if deserialize:
-                try:
-                    # Tenta JSON primeiro (mais rápido)
-                    return json.loads(value)
-                except:
-                    # Fallback para pickle
-                    return pickle.loads(value)
-            return value
-        except Exception as e:
+            value = self._get(key)
+        except redis.RedisError as e:
             logger.error(f"Erro ao recuperar do cache: {e}")
             return None
+        
+        if value is None or not deserialize:
+            return value
+        return self._deserialize(value)
+    
+    @staticmethod
+    def _serialize(value: Any) -> bytes:
+        """Serializa valor em msgpack, com fallback para pickle."""
+        try:
+            return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+        except (TypeError, ValueError, OverflowError):
+            return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    @staticmethod
+    def _deserialize(value: bytes) -> Any:
+        """Deserializa valor gravado por _serialize."""
+        try:
+            # strict_map_key=False: aceita chaves não-str (ex.: dicts com chaves int)
+            return msgpack.unpackb(
+                value, ext_hook=_msgpack_ext_hook, raw=False, strict_map_key=False
+            )
+        except ValueError:
+            # Fallback para pickle
+            try:
+                return pickle.loads(value)
+            except Exception as e:
+                # Formato desconhecido (ex.: entrada gravada em JSON antes da troca)
+                logger.warning(f"Valor de cache ilegível, ignorado: {e}")
+                return None
     
     def set(
         self, 
@@ -99,25 +206,185 @@ class CacheService:
             return False
         
         try:
-            if serialize:
-                try:
-                    # Tenta JSON primeiro
-                    serialized_value = json.dumps(value)
-                except:
-                    # Fallback para pickle
-                    serialized_value = pickle.dumps(value)
+            serialized_value = self._serialize(value) if serialize else value
+        except _ERROS_SERIALIZACAO as e:
+            logger.error(f"Erro ao serializar valor para o cache: {e}")
+            return False
+        
+        try:
+            if ttl:
+                self._setex(key, ttl, serialized_value)
             else:
-                serialized_value = value
+                self._set(key, serialized_value)
+            return True
+        except redis.RedisError as e:
+            logger.error(f"Erro ao armazenar no cache: {e}")
+            return False
+    
+    # Limites do flush em lote das escritas em segundo plano
+    WRITE_BATCH_SIZE = 256
+    WRITE_FLUSH_INTERVAL = 0.005  # segundos
+    WRITE_QUEUE_MAXSIZE = 10000
+    WRITE_CLOSE_TIMEOUT = 5.0  # segundos para gravar a fila no shutdown
+    
+    def set_async_bg(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+        """
+        Enfileira a escrita para ser enviada em lote por uma tarefa de fundo,
+        sem esperar a resposta do Redis. Deve ser chamado dentro de um event loop.
+        
+        Returns:
+            True se a escrita foi enfileirada (ou gravada diretamente quando
+            a fila está cheia)
+        """
+        if not self.redis_client:
+            return False
+        
+        try:
+            serialized_value = self._serialize(value)
+        except _ERROS_SERIALIZACAO as e:
+            logger.error(f"Erro ao serializar valor para o cache: {e}")
+            return False
+        
+        queue = self._ensure_write_flusher()
+        try:
+            queue.put_nowait((key, serialized_value, ttl))
+        except asyncio.QueueFull:
+            # Fila saturada: grava de forma síncrona para não perder a escrita
+            return self.set(key, value, ttl)
+        return True
+    
+    def _ensure_write_flusher(self) -> asyncio.Queue:
+        """Cria fila e tarefa de flush para o event loop atual, se necessário."""
+        loop = asyncio.get_running_loop()
+        if (
+            self._write_queue is None
+            or self._write_loop is not loop
+            or self._write_flusher_task.done()
+        ):
+            if self._write_queue is not None:
+                # Fila de outro loop ou de uma tarefa encerrada: grava o que
+                # ficou nela antes de descartá-la
+                pendentes = self._pendentes(self._write_queue)
+                if pendentes:
+                    logger.warning(
+                        f"{len(pendentes)} escritas pendentes na fila anterior do cache; "
+                        "gravando de forma síncrona"
+                    )
+                    self._gravar_lote(pendentes)
             
+            self._write_queue = asyncio.Queue(maxsize=self.WRITE_QUEUE_MAXSIZE)
+            self._write_loop = loop
+            self._write_flusher_task = loop.create_task(self._write_flusher(self._write_queue))
+        return self._write_queue
+    
+    @staticmethod
+    def _pendentes(queue: asyncio.Queue) -> List[Tuple[str, bytes, Optional[int]]]:
+        """Retira da fila todas as escritas ainda não enviadas."""
+        itens = []
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return itens
+            if item is not None:
+                itens.append(item)
+    
+    def _gravar_lote(self, lote: List[Tuple[str, bytes, Optional[int]]]):
+        """Envia um lote de escritas num pipeline sem transação (bloqueante)."""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key, value, ttl in lote:
             if ttl:
-                self.redis_client.setex(key, ttl, serialized_value)
+                pipe.setex(key, ttl, value)
             else:
-                self.redis_client.set(key, serialized_value)
+                pipe.set(key, value)
+        
+        try:
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Erro ao gravar lote no cache: {e}")
+    
+    async def _write_flusher(self, queue: asyncio.Queue):
+        """
+        Drena a fila de escritas em lotes de até WRITE_BATCH_SIZE operações
+        (ou o que chegar em WRITE_FLUSH_INTERVAL). Um None na fila (enviado
+        por fechar) grava o lote atual e encerra a tarefa.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
             
-            return True
-        except Exception as e:
+            lote = [item]
+            encerrar = False
+            limite = loop.time() + self.WRITE_FLUSH_INTERVAL
+            while len(lote) < self.WRITE_BATCH_SIZE:
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), restante)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    encerrar = True
+                    break
+                lote.append(item)
+            
+            # Cliente síncrono: executa o pipeline fora do event loop
+            await asyncio.to_thread(self._gravar_lote, lote)
+            if encerrar:
+                return
+    
+    async def fechar(self):
+        """
+        Grava as escritas pendentes e encerra a tarefa de flush (chamado no
+        shutdown da aplicação).
+        """
+        tarefa, fila = self._write_flusher_task, self._write_queue
+        self._write_flusher_task = self._write_queue = self._write_loop = None
+        if tarefa is None:
+            return
+        
+        if not tarefa.done():
+            await fila.put(None)
+            try:
+                await asyncio.wait_for(tarefa, self.WRITE_CLOSE_TIMEOUT)
+            except asyncio.TimeoutError:
+                # wait_for já cancelou a tarefa
+                logger.warning("Flush das escritas do cache não terminou a tempo")
+        
+        # Sobras de uma tarefa que morreu ou não terminou a tempo
+        pendentes = self._pendentes(fila)
+        if pendentes:
+            await asyncio.to_thread(self._gravar_lote, pendentes)
+    
+    def get_or_set(self, key: str, value: Any, ttl: int) -> Any:
+        """
+        Grava valor com TTL apenas se a chave não existir (operação atômica).
+        
+        Returns:
+            Valor presente no cache após a operação. Se outro processo gravou
+            a chave antes, retorna o valor dele.
+        """
+        if not self.redis_client:
+            return value
+        
+        try:
+            serialized_value = self._serialize(value)
+        except _ERROS_SERIALIZACAO as e:
+            logger.error(f"Erro ao serializar valor para o cache: {e}")
+            return value
+        
+        try:
+            stored = self._get_or_set_script(keys=[key], args=[serialized_value, ttl])
+        except redis.RedisError as e:
             logger.error(f"Erro ao armazenar no cache: {e}")
-            return False
+            return value
+        
+        if stored is None:
+            return value
+        return self._deserialize(stored)
     
     def delete(self, key: str) -> bool:
         """Remove chave do cache."""
@@ -127,7 +394,7 @@ class CacheService:
         try:
             self.redis_client.delete(key)
             return True
-        except Exception as e:
+        except redis.RedisError as e:
             logger.error(f"Erro ao deletar do cache: {e}")
             return False
     
@@ -146,7 +413,7 @@ class CacheService:
             if keys:
                 return self.redis_client.delete(*keys)
             return 0
-        except Exception as e:
+        except redis.RedisError as e:
             logger.error(f"Erro ao deletar padrão do cache: {e}")
             return 0
     
@@ -157,7 +424,7 @@ class CacheService:
         
         try:
             return bool(self.redis_client.exists(key))
-        except Exception as e:
+        except redis.RedisError as e:
             logger.error(f"Erro ao verificar existência no cache: {e}")
             return False
     
@@ -168,7 +435,7 @@ class CacheService:
         
         try:
             return self.redis_client.incr(key, amount)
-        except Exception as e:
+        except redis.RedisError as e:
             logger.error(f"Erro ao incrementar no cache: {e}")
             return None
     
@@ -180,7 +447,7 @@ class CacheService:
         try:
             ttl = self.redis_client.ttl(key)
             return ttl if ttl >= 0 else None
-        except Exception as e:
+        except redis.RedisError as e:
             logger.error(f"Erro ao obter TTL: {e}")
             return None
     
@@ -194,7 +461,7 @@ class CacheService:
                 value = json.dumps(value)
             self.redis_client.hset(name, key, value)
             return True
-        except Exception as e:
+        except redis.RedisError as e:
             logger.error(f"Erro ao armazenar em hash: {e}")
             return False
     
@@ -208,7 +475,7 @@ class CacheService:
             if value and deserialize:
                 return json.loads(value)
             return value
-        except Exception as e:
+        except redis.RedisError as e:
             logger.error(f"Erro ao recuperar de hash: {e}")
             return None
     
@@ -219,17 +486,85 @@ class CacheService:
         
         try:
             data = self.redis_client.hgetall(name)
-            if deserialize:
-                return {k.decode(): json.loads(v) for k, v in data.items()}
-            return {k.decode(): v.decode() for k, v in data.items()}
-        except Exception as e:
+        except redis.RedisError as e:
             logger.error(f"Erro ao recuperar hash completo: {e}")
             return {}
+        
+        if deserialize:
+            return {k.decode(): orjson.loads(v) for k, v in data.items()}
+        return {k.decode(): v.decode() for k, v in data.items()}
+    
+    def get_hash_fields(self, name: str, fields: List[str], deserialize: bool = True) -> dict:
+        """
+        Recupera apenas os campos informados de um hash (HMGET).
+        
+        Campos inexistentes não aparecem no resultado.
+        """
+        if not self.redis_client or not fields:
+            return {}
+        
+        try:
+            values = self.redis_client.hmget(name, fields)
+        except redis.RedisError as e:
+            logger.error(f"Erro ao recuperar campos de hash: {e}")
+            return {}
+        
+        if deserialize:
+            return {f: orjson.loads(v) for f, v in zip(fields, values) if v is not None}
+        return {f: v.decode() for f, v in zip(fields, values) if v is not None}
+    
+    def iter_hash(
+        self,
+        name: str,
+        deserialize: bool = True,
+        count: int = 200
+    ) -> Iterator[Tuple[str, Any]]:
+        """
+        Percorre um hash grande em lotes (HSCAN) sem carregá-lo inteiro.
+        
+        Args:
+            name: Nome do hash
+            deserialize: Se deve deserializar os valores
+            count: Quantidade sugerida de campos por iteração do HSCAN
+        """
+        if not self.redis_client:
+            return
+        
+        try:
+            for k, v in self.redis_client.hscan_iter(name, count=count):
+                yield k.decode(), orjson.loads(v) if deserialize else v.decode()
+        except redis.RedisError as e:
+            logger.error(f"Erro ao percorrer hash: {e}")
 
 # Instância global do cache
 cache_service = CacheService()
 
 # Decorador para cache automático
+# Cálculos em andamento por event loop e chave de cache (single-flight do
+# cache_result); um future só pode ser aguardado no loop que o criou
+_inflight: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Future] = {}
+
+def _parametros_chave(
+    assinatura: inspect.Signature,
+    key_params: Optional[list],
+    args: tuple,
+    kwargs: dict
+) -> dict:
+    """
+    Extrai os parâmetros que compõem a chave do cache, aceitando-os tanto
+    posicionais quanto nomeados.
+    """
+    try:
+        argumentos = assinatura.bind_partial(*args, **kwargs).arguments
+    except TypeError:
+        argumentos = kwargs
+    
+    if key_params:
+        # Usa apenas os parâmetros especificados
+        return {k: argumentos[k] for k in key_params if k in argumentos}
+    # Usa todos os argumentos, exceto a instância
+    return {k: v for k, v in argumentos.items() if k not in ('self', 'cls')}
+
 def cache_result(
     prefix: str, 
     ttl: Optional[int] = None,
@@ -238,23 +573,25 @@ def cache_result(
     """
     Decorador para cachear resultados de funções.
     
+    Em funções assíncronas, chamadas simultâneas com a mesma chave (cache
+    frio) aguardam um único cálculo em vez de repeti-lo.
+    
     Args:
         prefix: Prefixo da chave do cache
         ttl: Tempo de vida em segundos (padrão: settings.CACHE_TTL)
         key_params: Lista de parâmetros a incluir na chave
     """
     def decorator(func):
+        assinatura = inspect.signature(func)
+        
         @wraps(func)
         async def async_wrapper(*args, **kwargs):
-            # Gera chave do cache
-            cache_params = {}
-            if key_params:
-                # Usa apenas os parâmetros especificados
-                cache_params = {k: kwargs.get(k) for k in key_params if k in kwargs}
-            else:
-                # Usa todos os kwargs
-                cache_params = kwargs
+            # Cache desligado ou indisponível: nem calcula a chave
+            if not settings.CACHE_ENABLED or cache_service.redis_client is None:
+                return await func(*args, **kwargs)
             
+            # Gera chave do cache
+            cache_params = _parametros_chave(assinatura, key_params, args, kwargs)
             cache_key = cache_service._generate_key(prefix, cache_params)
             
             # Verifica cache
@@ -263,25 +600,50 @@ def cache_result(
                 logger.debug(f"Cache hit para {cache_key}")
                 return cached_value
             
-            # Executa função
-            result = await func(*args, **kwargs)
+            # Mesma chave já sendo calculada: aguarda o resultado dela. O shield
+            # impede que o cancelamento de um waiter cancele o future de todos
+            loop = asyncio.get_running_loop()
+            chave_inflight = (loop, cache_key)
+            em_andamento = _inflight.get(chave_inflight)
+            if em_andamento is not None:
+                logger.debug(f"Aguardando cálculo em andamento para {cache_key}")
+                return await asyncio.shield(em_andamento)
+            
+            fut = loop.create_future()
+            # Marca a exceção como consumida mesmo sem ninguém aguardando
+            fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+            _inflight[chave_inflight] = fut
+            
+            try:
+                # Executa função
+                result = await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                fut.cancel()
+                raise
+            except Exception as e:
+                if not fut.done():
+                    fut.set_exception(e)
+                raise
+            finally:
+                del _inflight[chave_inflight]
             
-            # Armazena no cache
+            if not fut.done():
+                fut.set_result(result)
+            
+            # Armazena no cache em segundo plano (não espera o Redis)
             cache_ttl = ttl or settings.CACHE_TTL
-            cache_service.set(cache_key, result, cache_ttl)
-            logger.debug(f"Resultado cacheado em {cache_key} por {cache_ttl}s")
+            cache_service.set_async_bg(cache_key, result, cache_ttl)
+            logger.debug(f"Resultado enfileirado para cache em {cache_key} por {cache_ttl}s")
             
             return result
         
         @wraps(func)
         def sync_wrapper(*args, **kwargs):
             # Versão síncrona do wrapper
-            cache_params = {}
-            if key_params:
-                cache_params = {k: kwargs.get(k) for k in key_params if k in kwargs}
-            else:
-                cache_params = kwargs
+            if not settings.CACHE_ENABLED or cache_service.redis_client is None:
+                return func(*args, **kwargs)
             
+            cache_params = _parametros_chave(assinatura, key_params, args, kwargs)
             cache_key = cache_service._generate_key(prefix, cache_params)
             
             cached_value = cache_service.get(cache_key)
@@ -292,7 +654,7 @@ def cache_result(
             result = func(*args, **kwargs)
             
             cache_ttl = ttl or settings.CACHE_TTL
-            cache_service.set(cache_key, result, cache_ttl)
+            result = cache_service.get_or_set(cache_key, result, cache_ttl)
             logger.debug(f"Resultado cacheado em {cache_key} por {cache_ttl}s")
             
             return result
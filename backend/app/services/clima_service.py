@@ -1,9 +1,12 @@
 # Serviços de clima
 import httpx
 import asyncio
-from typing import Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 import logging
+import time
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 import pandas as pd
 import numpy as np
@@ -15,24 +18,193 @@ from app.models.user import User
 from app.services.cache_service import cache_service, cache_result, CacheKeys
 from app.core.database import get_db_context
 
+if TYPE_CHECKING:
+    from sklearn.neighbors import BallTree
+
 logger = logging.getLogger(__name__)
 
+# Número de faixas de temperatura (mesma largura) avaliadas nos padrões
+N_FAIXAS_TEMPERATURA = 5
+
+# Campos INMET -> colunas de DadoClimatico
+COLUNAS_INMET = {
+    'TEM_INS': 'temperatura',
+    'TEM_MIN': 'temperatura_min',
+    'TEM_MAX': 'temperatura_max',
+    'UMD_INS': 'umidade',
+    'PRE_INS': 'pressao',
+    'VEN_VEL': 'vento_velocidade',
+    'VEN_DIR': 'vento_direcao',
+    'CHUVA': 'precipitacao_1h',
+    'RAD_GLO': 'radiacao_solar',
+    'PTO_INS': 'ponto_orvalho',
+    'PRE_MAX': 'pressao_nivel_mar',
+}
+
+# Campos numéricos/textuais de cada previsão gerada em _buscar_previsao_gfs
+CAMPOS_PREVISAO = [
+    'temperatura', 'temperatura_min', 'temperatura_max', 'umidade',
+    'probabilidade_chuva', 'precipitacao_esperada', 'vento_velocidade',
+    'vento_direcao', 'condicao_tempo', 'confiabilidade'
+]
+
+# Raio médio da Terra, para converter distâncias haversine (radianos)
+RAIO_TERRA_KM = 6371.0
+
+# Linhas por INSERT em lote (limite de parâmetros do PostgreSQL)
+LOTE_INSERT_CLIMA = 2000
+
+# Vendas do usuário no período com a leitura climática da mesma hora
+_SQL_VENDAS_CLIMA = """
+    FROM vendas v
+    JOIN dados_climaticos dc
+        ON DATE(v.data_venda) = DATE(dc.data_hora)
+        AND v.hora = EXTRACT(hour FROM dc.data_hora)
+    WHERE v.user_id = :user_id
+    AND v.data_venda >= :data_inicio
+    AND dc.temperatura IS NOT NULL
+"""
+
+# Correlações e padrões numa única varredura da junção vendas x clima: o CTE
+# base, lido por várias agregações, é materializado uma vez pelo PostgreSQL.
+# Retorna uma linha por categoria mais a do total (GROUPING SETS), com:
+# - Pearson de valor_total contra cada variável climática (chuva ausente
+#   conta como zero)
+# - percentil 75 da temperatura (interpolação linear, como no pandas) e
+#   médias de vendas em dias quentes/geral/com e sem chuva
+# - faixa de temperatura com maior venda média (N_FAIXAS_TEMPERATURA faixas
+#   de mesma largura, via width_bucket)
+SQL_ANALISE_CLIMA_VENDAS = f"""
+    WITH base AS (
+        SELECT
+            v.categoria,
+            v.valor_total,
+            dc.temperatura,
+            dc.umidade,
+            COALESCE(dc.precipitacao_24h, 0) AS precipitacao_24h,
+            dc.vento_velocidade
+        {_SQL_VENDAS_CLIMA}
+    ),
+    limites AS (
+        SELECT
+            percentile_cont(0.75) WITHIN GROUP (ORDER BY temperatura) AS temp_q75,
+            MIN(temperatura) AS temp_min,
+            MAX(temperatura) AS temp_max,
+            AVG(valor_total) AS media_geral
+        FROM base
+    ),
+    medias AS (
+        SELECT
+            COUNT(*) FILTER (WHERE b.temperatura > l.temp_q75) AS n_quente,
+            AVG(b.valor_total) FILTER (WHERE b.temperatura > l.temp_q75) AS media_quente,
+            COUNT(*) FILTER (WHERE b.precipitacao_24h > 0) AS n_chuva,
+            AVG(b.valor_total) FILTER (WHERE b.precipitacao_24h > 0) AS media_chuva,
+            AVG(b.valor_total) FILTER (WHERE b.precipitacao_24h = 0) AS media_sem_chuva
+        FROM base b
+        CROSS JOIN limites l
+    ),
+    melhor_faixa AS (
+        SELECT
+            CASE
+                WHEN l.temp_max > l.temp_min THEN LEAST(
+                    width_bucket(b.temperatura, l.temp_min, l.temp_max, {N_FAIXAS_TEMPERATURA}),
+                    {N_FAIXAS_TEMPERATURA}
+                )
+                ELSE 1
+            END AS faixa,
+            COUNT(*) AS faixa_contagem
+        FROM base b
+        CROSS JOIN limites l
+        GROUP BY 1
+        ORDER BY AVG(b.valor_total) DESC
+        LIMIT 1
+    ),
+    correlacoes AS (
+        SELECT
+            categoria,
+            GROUPING(categoria) AS total,
+            COUNT(*) AS amostras,
+            CORR(valor_total, temperatura) AS corr_temperatura,
+            CORR(valor_total, umidade) AS corr_umidade,
+            CORR(valor_total, precipitacao_24h) AS corr_chuva,
+            CORR(valor_total, vento_velocidade) AS corr_vento
+        FROM base
+        GROUP BY GROUPING SETS ((categoria), ())
+    )
+    SELECT
+        c.*,
+        l.temp_q75,
+        l.media_geral,
+        m.*,
+        l.temp_min + (f.faixa - 1) * (l.temp_max - l.temp_min) / {N_FAIXAS_TEMPERATURA} AS faixa_esquerda,
+        l.temp_min + f.faixa * (l.temp_max - l.temp_min) / {N_FAIXAS_TEMPERATURA} AS faixa_direita,
+        f.faixa_contagem
+    FROM correlacoes c
+    CROSS JOIN limites l
+    CROSS JOIN medias m
+    LEFT JOIN melhor_faixa f ON true
+"""
+
+def _arredondar_corr(valor) -> float:
+    """
+    Arredonda um coeficiente vindo do banco (NULL quando indefinido -> NaN).
+    """
+    return float('nan') if pd.isna(valor) else round(float(valor), 3)
+
+def _criar_http_client() -> httpx.AsyncClient:
+    """
+    Cria o cliente HTTP compartilhado (HTTP/2 e conexões keep-alive
+    reaproveitadas entre requisições ao INMET e ao NOMADS).
+    """
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        limits=httpx.Limits(
+            max_connections=100,
+            max_keepalive_connections=50,
+            keepalive_expiry=300.0
+        )
+    )
+
 class ClimaService:
     """
     Serviço para gerenciar dados climáticos.
     """
     
+    # Intervalo de recarga do mapa código INMET -> id e do índice espacial das estações
+    ESTACOES_REFRESH_SEGUNDOS = 600
+    
     def __init__(self):
         self.inmet_base_url = settings.INMET_BASE_URL
         self.nomads_base_url = settings.NOMADS_BASE_URL
-        self.http_client = None
+        self.http_client = _criar_http_client()
+        
+        # Gerador usado na simulação do GFS, criado uma única vez
+        self._rng = np.random.default_rng()
+        
+        # Carregado sob demanda em _obter_estacao_id
+        self._estacao_id_por_codigo: Dict[str, int] = {}
+        self._estacoes_carregadas_em: Optional[float] = None
+        
+        # Índice espacial das estações ativas, usado em buscar_estacoes_proximas
+        self._estacoes_ativas: List[Dict] = []
+        self._arvore_estacoes: Optional['BallTree'] = None
+        self._arvore_estacoes_em: Optional[float] = None
     
     async def __aenter__(self):
-        self.http_client = httpx.AsyncClient(timeout=30.0)
+        if self.http_client.is_closed:
+            self.http_client = _criar_http_client()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.http_client:
+        # O cliente é compartilhado entre requisições; fechado em fechar()
+        pass
+    
+    async def fechar(self):
+        """
+        Fecha o cliente HTTP compartilhado (chamado no shutdown da aplicação).
+        """
+        if not self.http_client.is_closed:
             await self.http_client.aclose()
     
     @cache_result(CacheKeys.CLIMA_ATUAL, ttl=300, key_params=['estacao_codigo'])
@@ -91,42 +263,133 @@ class ClimaService:
             'pressao_nivel_mar': float(dados_raw.get('PRE_MAX', 0) or 0),
         }
     
+    def _processar_dados_inmet_batch(self, dados_raw_list: List[Dict]) -> pd.DataFrame:
+        """
+        Processa uma lista de registros brutos do INMET de uma vez.
+        
+        Equivalente vetorizado de _processar_dados_inmet: cada campo vira uma
+        coluna float64 contígua, sem um dict e doze float() por registro.
+        """
+        df = pd.DataFrame(dados_raw_list).reindex(
+            columns=['DT_MEDICAO', *COLUNAS_INMET]
+        ).rename(columns=COLUNAS_INMET)
+        
+        colunas_numericas = list(COLUNAS_INMET.values())
+        df[colunas_numericas] = df[colunas_numericas].apply(
+            pd.to_numeric, errors='coerce'
+        ).fillna(0.0).astype(np.float64)
+        df['data_hora'] = pd.to_datetime(df.pop('DT_MEDICAO'), errors='coerce')
+        
+        return df.dropna(subset=['data_hora'])
+    
+    async def importar_historico_inmet(
+        self,
+        estacao_codigo: str,
+        data_inicio: datetime,
+        data_fim: datetime
+    ) -> int:
+        """
+        Importa o histórico de uma estação INMET no período informado.
+        
+        Returns:
+            Número de registros recebidos
+        """
+        try:
+            url = (
+                f"{self.inmet_base_url}/estacao/"
+                f"{data_inicio:%Y-%m-%d}/{data_fim:%Y-%m-%d}/{estacao_codigo}"
+            )
+            response = await self.http_client.get(url)
+            
+            if response.status_code != 200:
+                logger.error(f"Erro ao buscar histórico INMET: {response.status_code}")
+                return 0
+            
+            dados = response.json()
+            if not dados:
+                return 0
+            
+            df = self._processar_dados_inmet_batch(dados)
+            await self._salvar_dados_climaticos(estacao_codigo, df)
+            return len(df)
+            
+        except Exception as e:
+            logger.error(f"Erro ao importar histórico INMET: {e}")
+            return 0
+    
+    def _obter_estacao_id(self, db: Session, estacao_codigo: str) -> Optional[int]:
+        """
+        Resolve código INMET -> id da estação usando o mapa em memória,
+        recarregado a cada ESTACOES_REFRESH_SEGUNDOS.
+        """
+        agora = time.monotonic()
+        if (
+            self._estacoes_carregadas_em is None
+            or agora - self._estacoes_carregadas_em > self.ESTACOES_REFRESH_SEGUNDOS
+        ):
+            self._estacao_id_por_codigo = dict(
+                db.query(EstacaoMeteorologica.codigo_inmet, EstacaoMeteorologica.id).all()
+            )
+            self._estacoes_carregadas_em = agora
+        
+        estacao_id = self._estacao_id_por_codigo.get(estacao_codigo)
+        if estacao_id is None:
+            # Estação cadastrada após a última recarga
+            estacao_id = db.query(EstacaoMeteorologica.id).filter(
+                EstacaoMeteorologica.codigo_inmet == estacao_codigo
+            ).scalar()
+            if estacao_id is not None:
+                self._estacao_id_por_codigo[estacao_codigo] = estacao_id
+        return estacao_id
+    
     async def _salvar_dado_climatico(self, estacao_codigo: str, dados: Dict):
         """
         Salva dados climáticos no banco.
+        
+        Leituras já gravadas (mesma estação e hora) são ignoradas pelo
+        índice único, num único INSERT ... ON CONFLICT DO NOTHING.
         """
         try:
             with get_db_context() as db:
-                # Busca estação
-                estacao = db.query(EstacaoMeteorologica).filter(
-                    EstacaoMeteorologica.codigo_inmet == estacao_codigo
-                ).first()
+                estacao_id = self._obter_estacao_id(db, estacao_codigo)
                 
-                if not estacao:
+                if estacao_id is None:
                     logger.warning(f"Estação {estacao_codigo} não encontrada")
                     return
                 
-                # Verifica se já existe dado para esta hora
-                existe = db.query(DadoClimatico).filter(
-                    DadoClimatico.estacao_id == estacao.id,
-                    DadoClimatico.data_hora == dados['data_hora']
-                ).first()
-                
-                if existe:
-                    return
-                
-                # Cria registro
-                dado_climatico = DadoClimatico(
-                    estacao_id=estacao.id,
+                stmt = pg_insert(DadoClimatico).values(
+                    estacao_id=estacao_id,
                     **dados
-                )
+                ).on_conflict_do_nothing(index_elements=['estacao_id', 'data_hora'])
+                db.execute(stmt)
+                
+        except Exception as e:
+            logger.error(f"Erro ao salvar dados climáticos: {e}")
+    
+    async def _salvar_dados_climaticos(self, estacao_codigo: str, df: pd.DataFrame):
+        """
+        Salva em lote as leituras de uma estação.
+        
+        O DataFrame só é convertido em registros na fronteira com o SQL;
+        leituras já gravadas são ignoradas pelo índice único.
+        """
+        if df.empty:
+            return
+        
+        try:
+            with get_db_context() as db:
+                estacao_id = self._obter_estacao_id(db, estacao_codigo)
                 
-                db.add(dado_climatico)
-                db.commit()
+                if estacao_id is None:
+                    logger.warning(f"Estação {estacao_codigo} não encontrada")
+                    return
                 
-                # Atualiza última leitura da estação
-                estacao.ultima_leitura = dados['data_hora']
-                db.commit()
+                rows = df.assign(estacao_id=estacao_id).to_dict('records')
+                for inicio in range(0, len(rows), LOTE_INSERT_CLIMA):
+                    stmt = pg_insert(DadoClimatico).values(
+                        rows[inicio:inicio + LOTE_INSERT_CLIMA]
+                    ).on_conflict_do_nothing(index_elements=['estacao_id', 'data_hora'])
+                    db.execute(stmt)
                 
         except Exception as e:
             logger.error(f"Erro ao salvar dados climáticos: {e}")
@@ -162,6 +425,42 @@ class ClimaService:
             logger.error(f"Erro ao obter previsão: {e}")
             return None
     
+    async def obter_previsoes_tempo_lote(
+        self,
+        points: List[Tuple[float, float]],
+        dias: int = 7,
+        concurrency: int = 32
+    ) -> List[Optional[List[Dict]]]:
+        """
+        Obtém previsões para vários pontos de forma concorrente.
+        
+        Args:
+            points: Lista de coordenadas (lat, lon)
+            dias: Número de dias de previsão (máx 15)
+            concurrency: Máximo de requisições simultâneas
+            
+        Returns:
+            Previsões na mesma ordem de points; None quando a busca daquele
+            ponto falhou
+        """
+        sem = asyncio.Semaphore(concurrency)
+        
+        async def one(lat: float, lon: float) -> Optional[List[Dict]]:
+            async with sem:
+                # Argumentos nomeados: compõem a chave do cache_result
+                return await self.obter_previsao_tempo(lat=lat, lon=lon, dias=dias)
+        
+        resultados = await asyncio.gather(*[one(*p) for p in points], return_exceptions=True)
+        
+        # Falhas viram None (como em obter_previsao_tempo), sem derrubar o lote
+        previsoes = []
+        for (lat, lon), resultado in zip(points, resultados):
+            if isinstance(resultado, BaseException):
+                logger.error(f"Erro ao obter previsão para ({lat}, {lon}): {resultado}")
+                resultado = None
+            previsoes.append(resultado)
+        return previsoes
+    
     async def _buscar_previsao_gfs(
         self, 
         lat: float, 
@@ -174,60 +473,75 @@ class ClimaService:
         # URL para acessar dados GFS (exemplo simplificado)
         # Em produção, implementar parser completo dos dados GRIB2
         
-        previsoes = []
-        
         # Por enquanto, retorna dados simulados
         # TODO: Implementar integração real com NOMADS
-        for d in range(dias):
-            data_previsao = datetime.now() + timedelta(days=d)
-            
-            # Simula variação realista de temperatura
-            temp_base = 25 + np.sin(d * 0.5) * 5
-            
-            previsao = {
-                'data_previsao': data_previsao,
-                'temperatura': round(temp_base + np.random.normal(0, 2), 1),
-                'temperatura_min': round(temp_base - 5 + np.random.normal(0, 1), 1),
-                'temperatura_max': round(temp_base + 5 + np.random.normal(0, 1), 1),
-                'umidade': round(70 + np.random.normal(0, 10), 0),
-                'probabilidade_chuva': round(max(0, min(100, 30 + np.random.normal(0, 20))), 0),
-                'precipitacao_esperada': round(max(0, np.random.exponential(5)), 1),
-                'vento_velocidade': round(max(0, 10 + np.random.normal(0, 5)), 1),
-                'vento_direcao': round(np.random.uniform(0, 360), 0),
-                'condicao_tempo': np.random.choice(['Ensolarado', 'Parcialmente Nublado', 'Nublado', 'Chuvoso']),
-                'modelo_previsao': 'GFS',
-                'confiabilidade': round(max(0.6, 0.95 - (d * 0.05)), 2)  # Diminui com o tempo
-            }
-            
-            previsoes.append(previsao)
+        # Gera todos os dias de uma vez (uma chamada NumPy por variável)
+        rng = self._rng
+        d = np.arange(dias)
+        agora = datetime.now()
         
-        return previsoes
+        # Simula variação realista de temperatura
+        temp_base = 25 + np.sin(d * 0.5) * 5
+        
+        temperatura = np.round(temp_base + rng.normal(0, 2, dias), 1)
+        temperatura_min = np.round(temp_base - 5 + rng.normal(0, 1, dias), 1)
+        temperatura_max = np.round(temp_base + 5 + rng.normal(0, 1, dias), 1)
+        umidade = np.round(70 + rng.normal(0, 10, dias), 0)
+        probabilidade_chuva = np.round(np.clip(30 + rng.normal(0, 20, dias), 0, 100), 0)
+        precipitacao_esperada = np.round(rng.exponential(5, dias), 1)
+        vento_velocidade = np.round(np.maximum(0, 10 + rng.normal(0, 5, dias)), 1)
+        vento_direcao = np.round(rng.uniform(0, 360, dias), 0)
+        condicao_tempo = rng.choice(['Ensolarado', 'Parcialmente Nublado', 'Nublado', 'Chuvoso'], dias)
+        confiabilidade = np.round(np.maximum(0.6, 0.95 - (d * 0.05)), 2)  # Diminui com o tempo
+        
+        # Um único array estruturado; .tolist() converte tudo numa chamada
+        campos = np.rec.fromarrays(
+            [
+                temperatura, temperatura_min, temperatura_max, umidade,
+                probabilidade_chuva, precipitacao_esperada, vento_velocidade,
+                vento_direcao, condicao_tempo, confiabilidade
+            ],
+            names=CAMPOS_PREVISAO
+        )
+        
+        return [
+            {
+                'data_previsao': agora + timedelta(days=dia),
+                **dict(zip(CAMPOS_PREVISAO, valores)),
+                'modelo_previsao': 'GFS'
+            }
+            for dia, valores in enumerate(campos.tolist())
+        ]
     
     async def _salvar_previsoes(self, lat: float, lon: float, previsoes: List[Dict]):
         """
         Salva previsões no banco de dados.
+        
+        Um único INSERT ... ON CONFLICT DO NOTHING grava todas as previsões
+        novas; as já existentes (mesmo local, data e modelo) são ignoradas
+        pelo índice único, sem consulta prévia.
         """
+        if not previsoes:
+            return
+        
         try:
             with get_db_context() as db:
-                for previsao in previsoes:
-                    # Verifica se já existe previsão para esta data/local
-                    existe = db.query(PrevisaoTempo).filter(
-                        PrevisaoTempo.latitude == lat,
-                        PrevisaoTempo.longitude == lon,
-                        PrevisaoTempo.data_previsao == previsao['data_previsao'],
-                        PrevisaoTempo.modelo_previsao == previsao['modelo_previsao']
-                    ).first()
-                    
-                    if not existe:
-                        nova_previsao = PrevisaoTempo(
-                            latitude=lat,
-                            longitude=lon,
-                            horizonte_horas=(previsao['data_previsao'] - datetime.now()).total_seconds() / 3600,
-                            **previsao
-                        )
-                        db.add(nova_previsao)
+                # Referência única para o horizonte de todas as previsões do lote
+                agora = datetime.now()
+                rows = [
+                    {
+                        'latitude': lat,
+                        'longitude': lon,
+                        'horizonte_horas': round((previsao['data_previsao'] - agora).total_seconds() / 3600),
+                        **previsao
+                    }
+                    for previsao in previsoes
+                ]
                 
-                db.commit()
+                stmt = pg_insert(PrevisaoTempo).values(rows).on_conflict_do_nothing(
+                    index_elements=['latitude', 'longitude', 'data_previsao', 'modelo_previsao']
+                )
+                db.execute(stmt)
         except Exception as e:
             logger.error(f"Erro ao salvar previsões: {e}")
     
@@ -252,58 +566,39 @@ class ClimaService:
                 # Busca dados de vendas e clima do período
                 data_inicio = datetime.now() - timedelta(days=periodo_dias)
                 
-                # Query para juntar vendas com dados climáticos
-                query = f"""
-                    SELECT 
-                        v.data_venda,
-                        v.valor_total,
-                        v.categoria,
-                        v.quantidade_itens,
-                        dc.temperatura,
-                        dc.umidade,
-                        dc.precipitacao_24h,
-                        dc.vento_velocidade,
-                        dc.condicao_tempo
-                    FROM vendas v
-                    LEFT JOIN dados_climaticos dc 
-                        ON DATE(v.data_venda) = DATE(dc.data_hora)
-                        AND v.hora = EXTRACT(hour FROM dc.data_hora)
-                    WHERE v.user_id = :user_id
-                    AND v.data_venda >= :data_inicio
-                    AND dc.temperatura IS NOT NULL
-                    ORDER BY v.data_venda
-                """
+                params = {'user_id': user_id, 'data_inicio': data_inicio}
                 
-                df = pd.read_sql(query, db.bind, params={
-                    'user_id': user_id,
-                    'data_inicio': data_inicio
-                })
+                # Correlações e padrões calculados no banco: uma linha por
+                # categoria mais a linha do total, sem trazer as vendas
+                agregado = pd.read_sql(SQL_ANALISE_CLIMA_VENDAS, db.bind, params=params)
                 
-                if df.empty or len(df) < 10:
+                total = agregado[agregado['total'] == 1]
+                total_registros = int(total['amostras'].iloc[0]) if not total.empty else 0
+                if total_registros < 10:
                     return {'erro': 'Dados insuficientes para análise'}
                 
-                # Calcula correlações
+                geral = total.iloc[0]
                 correlacoes = {
-                    'temperatura_vendas': round(df['valor_total'].corr(df['temperatura']), 3),
-                    'umidade_vendas': round(df['valor_total'].corr(df['umidade']), 3),
-                    'chuva_vendas': round(df['valor_total'].corr(df['precipitacao_24h'].fillna(0)), 3),
-                    'vento_vendas': round(df['valor_total'].corr(df['vento_velocidade']), 3),
+                    'temperatura_vendas': _arredondar_corr(geral['corr_temperatura']),
+                    'umidade_vendas': _arredondar_corr(geral['corr_umidade']),
+                    'chuva_vendas': _arredondar_corr(geral['corr_chuva']),
+                    'vento_vendas': _arredondar_corr(geral['corr_vento']),
                 }
                 
-                # Análise por categoria
-                correlacoes_categoria = {}
-                for categoria in df['categoria'].unique():
-                    df_cat = df[df['categoria'] == categoria]
-                    if len(df_cat) > 10:
-                        correlacoes_categoria[categoria] = {
-                            'temperatura': round(df_cat['valor_total'].corr(df_cat['temperatura']), 3),
-                            'umidade': round(df_cat['valor_total'].corr(df_cat['umidade']), 3),
-                            'chuva': round(df_cat['valor_total'].corr(df_cat['precipitacao_24h'].fillna(0)), 3),
-                            'amostras': len(df_cat)
-                        }
+                # Análise por categoria (apenas categorias com amostras suficientes)
+                por_categoria = agregado[(agregado['total'] == 0) & (agregado['amostras'] > 10)]
+                correlacoes_categoria = {
+                    linha.categoria: {
+                        'temperatura': _arredondar_corr(linha.corr_temperatura),
+                        'umidade': _arredondar_corr(linha.corr_umidade),
+                        'chuva': _arredondar_corr(linha.corr_chuva),
+                        'amostras': int(linha.amostras)
+                    }
+                    for linha in por_categoria.itertuples(index=False)
+                }
                 
-                # Identifica padrões
-                padroes = self._identificar_padroes_clima_vendas(df)
+                # Identifica padrões (agregados na linha do total)
+                padroes = self._identificar_padroes_clima_vendas(geral)
                 
                 # Recomendações baseadas nas correlações
                 recomendacoes = self._gerar_recomendacoes_clima(correlacoes, correlacoes_categoria)
@@ -314,40 +609,41 @@ class ClimaService:
                     'padroes_identificados': padroes,
                     'recomendacoes': recomendacoes,
                     'periodo_analisado': periodo_dias,
-                    'total_registros': len(df)
+                    'total_registros': total_registros
                 }
                 
         except Exception as e:
             logger.error(f"Erro ao analisar correlação: {e}")
             return {'erro': str(e)}
     
-    def _identificar_padroes_clima_vendas(self, df: pd.DataFrame) -> List[Dict]:
+    def _identificar_padroes_clima_vendas(self, agregados: pd.Series) -> List[Dict]:
         """
-        Identifica padrões entre clima e vendas.
+        Identifica padrões entre clima e vendas a partir dos agregados de
+        SQL_ANALISE_CLIMA_VENDAS (linha do total).
         """
         padroes = []
         
+        temp_q75 = agregados['temp_q75']
+        vendas_media_geral = agregados['media_geral']
+        n_quente, vendas_media_quente = agregados['n_quente'], agregados['media_quente']
+        n_chuva, vendas_media_chuva = agregados['n_chuva'], agregados['media_chuva']
+        vendas_media_sem_chuva = agregados['media_sem_chuva']
+        faixa_esquerda, faixa_direita = agregados['faixa_esquerda'], agregados['faixa_direita']
+        faixa_contagem = agregados['faixa_contagem']
+        
         # Padrão: Vendas em dias quentes
-        df_quente = df[df['temperatura'] > df['temperatura'].quantile(0.75)]
-        if len(df_quente) > 5:
-            vendas_media_quente = df_quente['valor_total'].mean()
-            vendas_media_geral = df['valor_total'].mean()
-            
+        if n_quente > 5:
             if vendas_media_quente > vendas_media_geral * 1.1:
                 padroes.append({
                     'tipo': 'temperatura_alta',
                     'descricao': 'Vendas aumentam em dias quentes',
                     'impacto': f"+{((vendas_media_quente / vendas_media_geral - 1) * 100):.1f}%",
                     'confianca': 'alta' if vendas_media_quente > vendas_media_geral * 1.2 else 'média',
-                    'temperatura_limite': round(df['temperatura'].quantile(0.75), 1)
+                    'temperatura_limite': round(temp_q75, 1)
                 })
         
         # Padrão: Vendas em dias chuvosos
-        df_chuva = df[df['precipitacao_24h'] > 0]
-        if len(df_chuva) > 5:
-            vendas_media_chuva = df_chuva['valor_total'].mean()
-            vendas_media_sem_chuva = df[df['precipitacao_24h'] == 0]['valor_total'].mean()
-            
+        if n_chuva > 5:
             if vendas_media_chuva < vendas_media_sem_chuva * 0.9:
                 padroes.append({
                     'tipo': 'chuva',
@@ -357,18 +653,13 @@ class ClimaService:
                 })
         
         # Padrão: Melhor faixa de temperatura
-        df['temp_faixa'] = pd.cut(df['temperatura'], bins=5)
-        vendas_por_faixa = df.groupby('temp_faixa')['valor_total'].agg(['mean', 'count'])
-        
-        if len(vendas_por_faixa) > 3:
-            melhor_faixa = vendas_por_faixa['mean'].idxmax()
-            if vendas_por_faixa.loc[melhor_faixa, 'count'] > 5:
-                padroes.append({
-                    'tipo': 'temperatura_otima',
-                    'descricao': f'Vendas são melhores entre {melhor_faixa.left:.0f}°C e {melhor_faixa.right:.0f}°C',
-                    'impacto': 'Faixa ótima identificada',
-                    'confianca': 'média'
-                })
+        if faixa_contagem > 5:
+            padroes.append({
+                'tipo': 'temperatura_otima',
+                'descricao': f'Vendas são melhores entre {faixa_esquerda:.0f}°C e {faixa_direita:.0f}°C',
+                'impacto': 'Faixa ótima identificada',
+                'confianca': 'média'
+            })
         
         return padroes
     
@@ -438,38 +729,64 @@ class ClimaService:
                 
                 data_inicio = datetime.now() - timedelta(days=dias_analise)
                 
-                # Busca dados climáticos do estado
-                estacoes = db.query(EstacaoMeteorologica).filter(
-                    EstacaoMeteorologica.estado == estado,
-                    EstacaoMeteorologica.ativa == True
-                ).all()
+                # Busca, numa única consulta, os dados de todas as estações ativas do estado
+                query = (
+                    select(
+                        DadoClimatico.estacao_id,
+                        EstacaoMeteorologica.cidade,
+                        DadoClimatico.data_hora,
+                        DadoClimatico.temperatura,
+                        DadoClimatico.precipitacao_24h
+                    )
+                    .join(EstacaoMeteorologica, DadoClimatico.estacao_id == EstacaoMeteorologica.id)
+                    .where(
+                        EstacaoMeteorologica.estado == estado,
+                        EstacaoMeteorologica.ativa == True,
+                        DadoClimatico.data_hora >= data_inicio
+                    )
+                    .order_by(DadoClimatico.estacao_id, DadoClimatico.data_hora)
+                )
+                df = pd.read_sql(query, db.bind)
                 
                 eventos = []
+                if df.empty:
+                    return eventos
                 
-                for estacao in estacoes:
-                    # Análise de temperatura
-                    dados_temp = db.query(DadoClimatico).filter(
-                        DadoClimatico.estacao_id == estacao.id,
-                        DadoClimatico.data_hora >= data_inicio
-                    ).order_by(DadoClimatico.data_hora).all()
-                    
-                    if dados_temp:
-                        # Detecta ondas de calor
-                        dias_quentes = 0
-                        for dado in dados_temp:
-                            if dado.temperatura and dado.temperatura > thresholds['onda_calor']['temperatura']:
-                                dias_quentes += 1
-                                if dias_quentes >= thresholds['onda_calor']['dias_consecutivos']:
-                                    eventos.append({
-                                        'tipo': 'onda_calor',
-                                        'severidade': 'alta',
-                                        'local': estacao.cidade,
-                                        'inicio': dado.data_hora - timedelta(days=dias_quentes-1),
-                                        'temperatura_maxima': dado.temperatura,
-                                        'descricao': f'Onda de calor em {estacao.cidade} - {dias_quentes} dias consecutivos acima de {thresholds["onda_calor"]["temperatura"]}°C'
-                                    })
-                            else:
-                                dias_quentes = 0
+                # Detecta ondas de calor: sequências de leituras quentes
+                # consecutivas da mesma estação (run-length vetorizado)
+                limite_calor = thresholds['onda_calor']['temperatura']
+                temperaturas = df['temperatura'].fillna(0).to_numpy(dtype=np.float64)
+                estacoes = df['estacao_id'].to_numpy()
+                quente = temperaturas > limite_calor
+                
+                troca_estacao = np.r_[True, estacoes[1:] != estacoes[:-1]]
+                comeca = quente & (troca_estacao | ~np.r_[False, quente[:-1]])
+                termina = quente & (np.r_[troca_estacao[1:], True] | ~np.r_[quente[1:], False])
+                inicios = np.flatnonzero(comeca)
+                fins = np.flatnonzero(termina) + 1
+                
+                if inicios.size == 0:
+                    return eventos
+                
+                duracoes = fins - inicios
+                # Leituras não quentes entre uma sequência e a próxima não
+                # superam o limite, então o máximo do trecho é o da sequência
+                maximas = np.maximum.reduceat(temperaturas, inicios)
+                ondas = np.flatnonzero(duracoes >= thresholds['onda_calor']['dias_consecutivos'])
+                
+                cidades = df['cidade'].to_numpy()
+                datas = df['data_hora'].dt.to_pydatetime()
+                
+                for k in ondas:
+                    i = inicios[k]
+                    eventos.append({
+                        'tipo': 'onda_calor',
+                        'severidade': 'alta',
+                        'local': cidades[i],
+                        'inicio': datas[i],
+                        'temperatura_maxima': float(maximas[k]),
+                        'descricao': f'Onda de calor em {cidades[i]} - {duracoes[k]} dias consecutivos acima de {limite_calor}°C'
+                    })
                 
                 return eventos
                 
@@ -485,58 +802,66 @@ class ClimaService:
     ) -> List[Dict]:
         """
         Busca estações meteorológicas próximas a uma coordenada.
+        
+        A consulta é feita numa BallTree em memória (distância haversine),
+        reconstruída a cada ESTACOES_REFRESH_SEGUNDOS, sem ida ao banco.
         """
         try:
-            with get_db_context() as db:
-                # Query usando função de distância (requer PostGIS)
-                query = """
-                    SELECT 
-                        id,
-                        codigo_inmet,
-                        nome,
-                        cidade,
-                        estado,
-                        latitude,
-                        longitude,
-                        ST_Distance(
-                            ST_MakePoint(:lon, :lat)::geography,
-                            ST_MakePoint(longitude, latitude)::geography
-                        ) / 1000 as distancia_km
-                    FROM estacoes_meteorologicas
-                    WHERE ativa = true
-                    AND ST_DWithin(
-                        ST_MakePoint(:lon, :lat)::geography,
-                        ST_MakePoint(longitude, latitude)::geography,
-                        :raio_m
-                    )
-                    ORDER BY distancia_km
-                    LIMIT 10
-                """
-                
-                result = db.execute(query, {
-                    'lat': lat,
-                    'lon': lon,
-                    'raio_m': raio_km * 1000
-                })
-                
-                estacoes = []
-                for row in result:
-                    estacoes.append({
-                        'id': row.id,
-                        'codigo_inmet': row.codigo_inmet,
-                        'nome': row.nome,
-                        'cidade': row.cidade,
-                        'estado': row.estado,
-                        'latitude': row.latitude,
-                        'longitude': row.longitude,
-                        'distancia_km': round(row.distancia_km, 1)
-                    })
-                
-                return estacoes
+            agora = time.monotonic()
+            if (
+                self._arvore_estacoes_em is None
+                or agora - self._arvore_estacoes_em > self.ESTACOES_REFRESH_SEGUNDOS
+            ):
+                self._carregar_arvore_estacoes()
+                self._arvore_estacoes_em = agora
+            
+            if self._arvore_estacoes is None:
+                return []
+            
+            indices, distancias = self._arvore_estacoes.query_radius(
+                np.radians([[lat, lon]]),
+                r=raio_km / RAIO_TERRA_KM,
+                return_distance=True,
+                sort_results=True
+            )
+            
+            return [
+                {
+                    **self._estacoes_ativas[i],
+                    'distancia_km': round(float(d) * RAIO_TERRA_KM, 1)
+                }
+                for i, d in zip(indices[0][:10], distancias[0][:10])
+            ]
                 
         except Exception as e:
             logger.error(f"Erro ao buscar estações próximas: {e}")
             return []
+    
+    def _carregar_arvore_estacoes(self):
+        """
+        Monta a BallTree (métrica haversine) com as estações ativas.
+        """
+        # Import aqui: o sklearn só é carregado quando a busca é usada
+        from sklearn.neighbors import BallTree
+        
+        with get_db_context() as db:
+            rows = db.query(
+                EstacaoMeteorologica.id,
+                EstacaoMeteorologica.codigo_inmet,
+                EstacaoMeteorologica.nome,
+                EstacaoMeteorologica.cidade,
+                EstacaoMeteorologica.estado,
+                EstacaoMeteorologica.latitude,
+                EstacaoMeteorologica.longitude
+            ).filter(EstacaoMeteorologica.ativa == True).all()
+        
+        self._estacoes_ativas = [dict(row._mapping) for row in rows]
+        if not rows:
+            self._arvore_estacoes = None
+            return
+        
+        coords = np.radians([(row.latitude, row.longitude) for row in rows])
+        self._arvore_estacoes = BallTree(coords, metric='haversine')
 
 # Instância global do serviço (para uso sem context manager)
 clima_service = ClimaService()
\ No newline at end of file
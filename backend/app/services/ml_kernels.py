@@ -0,0 +1,55 @@
+# Kernels numba do serviço de ML. Importado sob demanda por ml_service, para
+# que importar o app não carregue numba/llvmlite
+import numpy as np
+from numba import njit, prange
+
+from app.services.ml_service import LAGS_VENDAS, JANELAS_VENDAS, N_FEATURES_KERNEL_VENDAS
+
+@njit(parallel=True, cache=True)
+def features_vendas_kernel(valores, itens, temperatura, umidade, precipitacao, dia_semana):
+    """
+    Calcula, linha a linha e em paralelo, as features numéricas de vendas
+    (fim de semana, lags, média/desvio móveis e derivadas do clima).
+    
+    Equivale a shift(lag), rolling(janela).mean()/.std() (ddof=1) e às
+    operações do pandas: posições sem histórico suficiente ficam NaN.
+    
+    Returns:
+        Array (n, len(FEATURES_KERNEL_VENDAS))
+    """
+    n = valores.shape[0]
+    out = np.empty((n, N_FEATURES_KERNEL_VENDAS))
+    
+    for i in prange(n):
+        out[i, 0] = 1.0 if dia_semana[i] >= 5 else 0.0
+        
+        for k in range(LAGS_VENDAS.shape[0]):
+            lag = LAGS_VENDAS[k]
+            if i >= lag:
+                out[i, 1 + 2 * k] = valores[i - lag]
+                out[i, 2 + 2 * k] = itens[i - lag]
+            else:
+                out[i, 1 + 2 * k] = np.nan
+                out[i, 2 + 2 * k] = np.nan
+        
+        for k in range(JANELAS_VENDAS.shape[0]):
+            janela = JANELAS_VENDAS[k]
+            if i >= janela - 1:
+                soma = 0.0
+                for j in range(i - janela + 1, i + 1):
+                    soma += valores[j]
+                media = soma / janela
+                soma_quadrados = 0.0
+                for j in range(i - janela + 1, i + 1):
+                    soma_quadrados += (valores[j] - media) ** 2
+                out[i, 7 + 2 * k] = media
+                out[i, 8 + 2 * k] = np.sqrt(soma_quadrados / (janela - 1))
+            else:
+                out[i, 7 + 2 * k] = np.nan
+                out[i, 8 + 2 * k] = np.nan
+        
+        out[i, 11] = temperatura[i] ** 2
+        out[i, 12] = temperatura[i] * umidade[i]
+        out[i, 13] = 1.0 if precipitacao[i] > 0 else 0.0
+    
+    return out
@@ -3,18 +3,16 @@ import numpy as np
 import pandas as pd
 from typing import Dict, List, Optional, Tuple, Any
 import joblib
+from joblib import Parallel, delayed
+from cachetools import LRUCache
 import json
+import pickle
 from datetime import datetime, timedelta
 import logging
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split, cross_val_score, TimeSeriesSplit
-from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-import tensorflow as tf
-from prophet import Prophet
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
 import os
+from sqlalchemy import update
 
 from app.core.config import settings
 from app.models.predicoes import Predicao, ModeloML, TipoPredicao, StatusPredicao
@@ -24,14 +22,93 @@ from app.core.database import get_db_context
 
 logger = logging.getLogger(__name__)
 
+# Defasagens e janelas móveis usadas nas features de vendas
+LAGS_VENDAS = np.array([1, 7, 30])
+JANELAS_VENDAS = np.array([7, 30])
+
+# Colunas preenchidas por features_vendas_kernel (ml_kernels), na ordem da
+# matriz retornada
+FEATURES_KERNEL_VENDAS = [
+    'is_fim_semana',
+    'vendas_lag_1', 'itens_lag_1',
+    'vendas_lag_7', 'itens_lag_7',
+    'vendas_lag_30', 'itens_lag_30',
+    'media_movel_7', 'desvio_movel_7',
+    'media_movel_30', 'desvio_movel_30',
+    'temp_squared', 'temp_umidade_interaction', 'chuva_binary'
+]
+N_FEATURES_KERNEL_VENDAS = len(FEATURES_KERNEL_VENDAS)
+
+# Layout escrito pelo kernel: fim de semana, (valor, itens) por lag,
+# (média, desvio) por janela e 3 derivadas do clima. Falha na importação se
+# a lista de nomes e o kernel divergirem
+assert N_FEATURES_KERNEL_VENDAS == 1 + 2 * len(LAGS_VENDAS) + 2 * len(JANELAS_VENDAS) + 3, (
+    "FEATURES_KERNEL_VENDAS não corresponde às colunas de features_vendas_kernel"
+)
+
+# Hiperparâmetros do modelo de vendas (HistGradientBoosting)
+HIPERPARAMETROS_VENDAS = {
+    'max_iter': 200,
+    'max_depth': 8,
+    'learning_rate': 0.05,
+    'early_stopping': True,
+    'warm_start': True,
+    'random_state': 42
+}
+
+# Iterações adicionadas a cada retreino incremental (warm start); ao atingir
+# o teto, o modelo é refeito do zero
+ITERACOES_RETREINO = 50
+MAX_ITER_WARM_START = 500
+
+# Jobs do sklearn dentro dos workers (pool de processos e loky): cada worker
+# já ocupa um núcleo, então não abre paralelismo próprio
+N_JOBS_WORKER = 1
+
+# Leitura do histórico de vendas: linhas por bloco e tipos reduzidos
+CHUNK_LEITURA_VENDAS = 50_000
+COLUNAS_CLIMA_VENDAS = ['temperatura', 'umidade', 'precipitacao_24h', 'vento_velocidade']
+COLUNAS_CATEGORICAS_VENDAS = ['categoria', 'canal', 'cidade', 'estado', 'condicao_tempo']
+
+# Partes do modelo em cache enviadas aos workers (sem a matriz de treino)
+CHAVES_MODELO_WORKER = (
+    'model', 'model_inferior', 'model_superior', 'scaler', 'feature_names', 'feature_index'
+)
+
+def _modelo_para_worker(modelo_info: Optional[Dict]) -> Optional[Dict]:
+    """
+    Cópia enxuta do modelo em cache para enviar a outro processo: só os
+    estimadores, o scaler e as features são serializados.
+    """
+    if modelo_info is None:
+        return None
+    return {chave: modelo_info[chave] for chave in CHAVES_MODELO_WORKER if chave in modelo_info}
+
+# Matriz normalizada e alvo devolvidos por _ajustar_modelo_vendas, usados só
+# nas métricas logo após o treino
+CHAVES_MATRIZ_TREINO = ('X_scaled', 'y')
+
+def _sem_matriz_treino(modelo_info: Dict) -> Dict:
+    """
+    Modelo sem a matriz de treino, para guardar em cache ou devolver de um
+    worker sem copiar X_scaled e y.
+    """
+    return {chave: valor for chave, valor in modelo_info.items() if chave not in CHAVES_MATRIZ_TREINO}
+
+# Quantis do intervalo de confiança das predições
+QUANTIL_INFERIOR = 0.05
+QUANTIL_SUPERIOR = 0.95
+
 class MLService:
     """
     Serviço de Machine Learning para predições.
     """
     
     def __init__(self):
-        self.models_cache = {}
-        self.executor = ThreadPoolExecutor(max_workers=4)
+        # Modelos em memória, limitados aos usados mais recentemente
+        self.models_cache = LRUCache(maxsize=settings.ML_MODEL_CACHE_SIZE)
+        # Processos para o trabalho de CPU (features, treino e predição)
+        self.executor = ProcessPoolExecutor(max_workers=4)
         self._ensure_model_directory()
         self._load_models()
     
@@ -51,15 +128,30 @@ class MLService:
                 for modelo in modelos_ativos:
                     try:
                         model_data = {
-                            'model': joblib.load(modelo.caminho_modelo),
+                            'feature_names': modelo.features_entrada,
                             'metadata': modelo.dict()
                         }
                         
-                        if modelo.caminho_scaler and os.path.exists(modelo.caminho_scaler):
-                            model_data['scaler'] = joblib.load(modelo.caminho_scaler)
+                        # Arquivo com o modelo pontual, os de quantis, o scaler e
+                        # as features; versões antigas guardam só o estimador,
+                        # com o scaler em arquivo separado. Os arrays ficam
+                        # mapeados do disco (páginas compartilhadas entre
+                        # processos e carregadas sob demanda)
+                        carregado = joblib.load(modelo.caminho_modelo, mmap_mode='r')
+                        if isinstance(carregado, dict):
+                            model_data.update(carregado)
+                        else:
+                            model_data['model'] = carregado
+                        
+                        if (
+                            'scaler' not in model_data
+                            and modelo.caminho_scaler
+                            and os.path.exists(modelo.caminho_scaler)
+                        ):
+                            model_data['scaler'] = joblib.load(modelo.caminho_scaler, mmap_mode='r')
                         
                         if modelo.caminho_encoder and os.path.exists(modelo.caminho_encoder):
-                            model_data['encoder'] = joblib.load(modelo.caminho_encoder)
+                            model_data['encoder'] = joblib.load(modelo.caminho_encoder, mmap_mode='r')
                         
                         self.models_cache[modelo.nome] = model_data
                         logger.info(f"Modelo {modelo.nome} carregado com sucesso")
@@ -116,55 +208,71 @@ class MLService:
     async def _processar_predicao(self, predicao_id: int):
         """
         Processa uma predição de forma assíncrona.
+        
+        Cada mudança de status é um único UPDATE numa sessão curta: nenhuma
+        conexão fica presa durante o processamento e o status PROCESSANDO
+        fica visível para quem consulta a predição.
         """
         try:
             with get_db_context() as db:
-                # Atualiza status
-                predicao = db.query(Predicao).filter(Predicao.id == predicao_id).first()
+                # Atualiza status e carrega a predição no mesmo comando
+                predicao = db.scalars(
+                    update(Predicao)
+                    .where(Predicao.id == predicao_id)
+                    .values(status=StatusPredicao.PROCESSANDO, iniciado_em=datetime.now())
+                    .returning(Predicao)
+                ).first()
                 if not predicao:
                     return
-                
-                predicao.status = StatusPredicao.PROCESSANDO
-                predicao.iniciado_em = datetime.now()
-                db.commit()
-                
-                # Executa predição baseada no tipo
-                if predicao.tipo == TipoPredicao.VENDAS_DIARIA:
-                    resultado = await self._prever_vendas_diarias(predicao)
-                elif predicao.tipo == TipoPredicao.VENDAS_SEMANAL:
-                    resultado = await self._prever_vendas_semanais(predicao)
-                elif predicao.tipo == TipoPredicao.DEMANDA_PRODUTO:
-                    resultado = await self._prever_demanda_produto(predicao)
-                else:
-                    raise ValueError(f"Tipo de predição não suportado: {predicao.tipo}")
-                
-                # Atualiza resultado
-                predicao.resultado = resultado['predicoes']
-                predicao.metricas = resultado['metricas']
-                predicao.confianca = resultado['confianca']
-                predicao.modelo_nome = resultado['modelo_utilizado']
-                predicao.modelo_versao = resultado.get('modelo_versao', '1.0')
-                predicao.status = StatusPredicao.CONCLUIDA
-                predicao.concluido_em = datetime.now()
-                predicao.tempo_processamento = (
-                    predicao.concluido_em - predicao.iniciado_em
-                ).total_seconds()
-                
-                db.commit()
-                
-                # Limpa cache relacionado
-                cache_service.delete_pattern(f"{CacheKeys.PREDICAO_RESULTADO}:{predicao_id}:*")
+                # Desvincula da sessão para não expirar no commit
+                db.expunge(predicao)
+            
+            # Executa predição baseada no tipo
+            if predicao.tipo == TipoPredicao.VENDAS_DIARIA:
+                resultado = await self._prever_vendas_diarias(predicao)
+            elif predicao.tipo == TipoPredicao.VENDAS_SEMANAL:
+                resultado = await self._prever_vendas_semanais(predicao)
+            elif predicao.tipo == TipoPredicao.DEMANDA_PRODUTO:
+                resultado = await self._prever_demanda_produto(predicao)
+            else:
+                raise ValueError(f"Tipo de predição não suportado: {predicao.tipo}")
+            
+            # Atualiza resultado
+            concluido_em = datetime.now()
+            with get_db_context() as db:
+                db.execute(
+                    update(Predicao)
+                    .where(Predicao.id == predicao_id)
+                    .values(
+                        resultado=resultado['predicoes'],
+                        metricas=resultado['metricas'],
+                        confianca=resultado['confianca'],
+                        modelo_nome=resultado['modelo_utilizado'],
+                        modelo_versao=resultado.get('modelo_versao', '1.0'),
+                        status=StatusPredicao.CONCLUIDA,
+                        concluido_em=concluido_em,
+                        tempo_processamento=(concluido_em - predicao.iniciado_em).total_seconds()
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+            
+            # Limpa cache relacionado
+            cache_service.delete_pattern(f"{CacheKeys.PREDICAO_RESULTADO}:{predicao_id}:*")
                 
         except Exception as e:
             logger.error(f"Erro ao processar predição {predicao_id}: {e}")
             
             with get_db_context() as db:
-                predicao = db.query(Predicao).filter(Predicao.id == predicao_id).first()
-                if predicao:
-                    predicao.status = StatusPredicao.ERRO
-                    predicao.erro_mensagem = str(e)
-                    predicao.concluido_em = datetime.now()
-                    db.commit()
+                db.execute(
+                    update(Predicao)
+                    .where(Predicao.id == predicao_id)
+                    .values(
+                        status=StatusPredicao.ERRO,
+                        erro_mensagem=str(e),
+                        concluido_em=datetime.now()
+                    )
+                    .execution_options(synchronize_session=False)
+                )
     
     async def _prever_vendas_diarias(self, predicao: Predicao) -> Dict:
         """
@@ -180,39 +288,32 @@ class MLService:
             if len(df_vendas) < settings.MIN_TRAINING_SAMPLES:
                 raise ValueError(f"Dados insuficientes para predição. Mínimo necessário: {settings.MIN_TRAINING_SAMPLES}")
             
-            # Prepara features
-            X, y, feature_names = self._preparar_features_vendas(df_vendas)
-            
             # Treina modelo se necessário ou usa existente
             modelo_nome = f"vendas_diarias_user_{predicao.user_id}"
+            modelo_info = self.models_cache.get(modelo_nome)
             
-            if modelo_nome not in self.models_cache:
-                modelo_info = await self._treinar_modelo_vendas(X, y, feature_names, modelo_nome)
-                self.models_cache[modelo_nome] = modelo_info
-            else:
-                modelo_info = self.models_cache[modelo_nome]
-            
-            # Gera predições
-            predicoes = await self._gerar_predicoes_vendas(
-                modelo_info,
+            # Features, treino, predições e métricas rodam num processo do
+            # pool, fora do event loop
+            loop = asyncio.get_running_loop()
+            modelo_treinado, predicoes, metricas = await loop.run_in_executor(
+                self.executor,
+                _treinar_e_prever_vendas,
+                df_vendas,
+                _modelo_para_worker(modelo_info),
                 predicao.data_inicio,
                 predicao.data_fim,
-                predicao.parametros,
-                df_vendas
+                predicao.parametros
             )
             
-            # Calcula métricas de confiança
-            metricas = self._calcular_metricas_confianca(
-                modelo_info['model'],
-                X,
-                y
-            )
+            if modelo_treinado is not None:
+                await self._salvar_modelo_db(modelo_nome, modelo_treinado)
+                self.models_cache[modelo_nome] = modelo_treinado
             
             return {
                 'predicoes': predicoes,
                 'metricas': metricas,
                 'confianca': metricas.get('r2_score', 0) * 100,
-                'modelo_utilizado': 'RandomForest',
+                'modelo_utilizado': 'HistGradientBoosting',
                 'modelo_versao': '1.0'
             }
             
@@ -233,14 +334,59 @@ class MLService:
             meses_historico = parametros.get('meses_historico', 12)
             data_inicio = datetime.now() - timedelta(days=meses_historico * 30)
             
-            # Query otimizada
+            # Query otimizada; leituras ausentes são preenchidas no banco com a
+            # média mensal (ou geral) das estações das cidades do usuário. As
+            # colunas de vendas são listadas uma a uma: temperatura, umidade e
+            # condicao_tempo também existem em vendas e sairiam duplicadas
             query = """
+                WITH clima_usuario AS (
+                    SELECT 
+                        EXTRACT(month FROM dc.data_hora) AS mes,
+                        dc.temperatura,
+                        dc.umidade,
+                        dc.vento_velocidade
+                    FROM dados_climaticos dc
+                    INNER JOIN estacoes_meteorologicas e 
+                        ON dc.estacao_id = e.id
+                    WHERE dc.data_hora >= :data_inicio
+                    AND (e.cidade, e.estado) IN (
+                        SELECT DISTINCT cidade, estado
+                        FROM vendas
+                        WHERE user_id = :user_id
+                        AND data_venda >= :data_inicio
+                    )
+                ),
+                clima_mensal AS (
+                    SELECT 
+                        mes,
+                        AVG(temperatura) AS temperatura,
+                        AVG(umidade) AS umidade,
+                        AVG(vento_velocidade) AS vento_velocidade
+                    FROM clima_usuario
+                    GROUP BY mes
+                ),
+                clima_geral AS (
+                    SELECT 
+                        AVG(temperatura) AS temperatura,
+                        AVG(umidade) AS umidade,
+                        AVG(vento_velocidade) AS vento_velocidade
+                    FROM clima_usuario
+                )
                 SELECT 
-                    v.*,
-                    dc.temperatura,
-                    dc.umidade,
-                    dc.precipitacao_24h,
-                    dc.vento_velocidade,
+                    v.id,
+                    v.data_venda,
+                    v.hora,
+                    v.valor_total,
+                    v.quantidade_itens,
+                    v.categoria,
+                    v.canal,
+                    v.cidade,
+                    v.estado,
+                    v.feriado,
+                    COALESCE(dc.temperatura, cm.temperatura, cg.temperatura) AS temperatura,
+                    COALESCE(dc.umidade, cm.umidade, cg.umidade) AS umidade,
+                    COALESCE(dc.precipitacao_24h, 0) AS precipitacao_24h,
+                    COALESCE(dc.vento_velocidade, cm.vento_velocidade, cg.vento_velocidade) AS vento_velocidade,
                     dc.condicao_tempo
                 FROM vendas v
                 LEFT JOIN lateral (
@@ -260,66 +406,48 @@ class MLService:
                     ORDER BY ABS(EXTRACT(epoch FROM (dc.data_hora - v.data_venda)))
                     LIMIT 1
                 ) dc ON true
+                LEFT JOIN clima_mensal cm ON cm.mes = EXTRACT(month FROM v.data_venda)
+                CROSS JOIN clima_geral cg
                 WHERE v.user_id = :user_id
                 AND v.data_venda >= :data_inicio
                 ORDER BY v.data_venda
             """
             
-            df = pd.read_sql(
+            # Lê em blocos, reduzindo as colunas climáticas a float32 a cada
+            # bloco para não manter o resultado inteiro em float64
+            chunks = pd.read_sql(
                 query,
                 db.bind,
-                params={'user_id': user_id, 'data_inicio': data_inicio}
+                params={'user_id': user_id, 'data_inicio': data_inicio},
+                chunksize=CHUNK_LEITURA_VENDAS
+            )
+            df = pd.concat(
+                (chunk.astype({c: np.float32 for c in COLUNAS_CLIMA_VENDAS}) for chunk in chunks),
+                ignore_index=True
             )
             
             # Converte colunas de data
             df['data_venda'] = pd.to_datetime(df['data_venda'])
             
-            # Preenche dados faltantes de clima
-            df['temperatura'].fillna(df['temperatura'].mean(), inplace=True)
-            df['umidade'].fillna(df['umidade'].mean(), inplace=True)
-            df['precipitacao_24h'].fillna(0, inplace=True)
-            df['vento_velocidade'].fillna(df['vento_velocidade'].mean(), inplace=True)
+            # Textos repetitivos como category (após o concat, para que todos
+            # os blocos compartilhem as mesmas categorias)
+            for coluna in COLUNAS_CATEGORICAS_VENDAS:
+                if coluna in df.columns:
+                    df[coluna] = df[coluna].astype('category')
             
             return df
     
+    @staticmethod
     def _preparar_features_vendas(
-        self,
         df: pd.DataFrame
     ) -> Tuple[np.ndarray, np.ndarray, List[str]]:
         """
         Prepara features para modelo de vendas.
         """
-        # Cria features temporais
-        df['dia_ano'] = df['data_venda'].dt.dayofyear
-        df['dia_mes'] = df['data_venda'].dt.day
-        df['dia_semana'] = df['data_venda'].dt.dayofweek
-        df['mes'] = df['data_venda'].dt.month
-        df['trimestre'] = df['data_venda'].dt.quarter
-        df['is_fim_semana'] = df['dia_semana'].isin([5, 6]).astype(int)
-        
-        # Features de lag (valores passados)
-        for lag in [1, 7, 30]:
-            df[f'vendas_lag_{lag}'] = df['valor_total'].shift(lag)
-            df[f'itens_lag_{lag}'] = df['quantidade_itens'].shift(lag)
-        
-        # Médias móveis
-        for window in [7, 30]:
-            df[f'media_movel_{window}'] = df['valor_total'].rolling(window).mean()
-            df[f'desvio_movel_{window}'] = df['valor_total'].rolling(window).std()
-        
-        # Features climáticas
-        df['temp_squared'] = df['temperatura'] ** 2
-        df['temp_umidade_interaction'] = df['temperatura'] * df['umidade']
-        df['chuva_binary'] = (df['precipitacao_24h'] > 0).astype(int)
-        
-        # Features categóricas (one-hot encoding)
-        categoria_dummies = pd.get_dummies(df['categoria'], prefix='categoria')
-        canal_dummies = pd.get_dummies(df['canal'], prefix='canal')
-        
-        # Remove NaN criados por lag e rolling
-        df.dropna(inplace=True)
-        
-        # Define features
+        # Colunas da matriz: numéricas seguidas do one-hot de categoria e canal
+        # (as colunas já são category, então os dummies cobrem todas as categorias)
+        categorias = df['categoria'].cat.categories
+        canais = df['canal'].cat.categories
         feature_cols = [
             'dia_ano', 'dia_mes', 'dia_semana', 'mes', 'trimestre',
             'is_fim_semana', 'feriado',
@@ -330,14 +458,56 @@ class MLService:
             'media_movel_7', 'media_movel_30',
             'desvio_movel_7', 'desvio_movel_30'
         ]
+        inicio_dummies = len(feature_cols)
+        feature_cols.extend(f'categoria_{c}' for c in categorias)
+        feature_cols.extend(f'canal_{c}' for c in canais)
+        indice = {nome: j for j, nome in enumerate(feature_cols)}
+        
+        # Cada feature é escrita direto na sua coluna de uma matriz float32
+        # pré-alocada, sem colunas intermediárias no DataFrame
+        X = np.empty((len(df), len(feature_cols)), dtype=np.float32)
+        
+        # Features temporais
+        datas = df['data_venda'].dt
+        dia_semana = datas.dayofweek.to_numpy(dtype=np.int64)
+        X[:, indice['dia_ano']] = datas.dayofyear.to_numpy()
+        X[:, indice['dia_mes']] = datas.day.to_numpy()
+        X[:, indice['dia_semana']] = dia_semana
+        X[:, indice['mes']] = datas.month.to_numpy()
+        X[:, indice['trimestre']] = datas.quarter.to_numpy()
+        
+        # Feriado e clima como vieram do banco (nulos viram NaN)
+        for coluna in ['feriado'] + COLUNAS_CLIMA_VENDAS:
+            X[:, indice[coluna]] = df[coluna].to_numpy(dtype=np.float32, na_value=np.nan)
         
-        # Adiciona dummies
-        df = pd.concat([df, categoria_dummies, canal_dummies], axis=1)
-        feature_cols.extend(categoria_dummies.columns.tolist())
-        feature_cols.extend(canal_dummies.columns.tolist())
+        # Features de lag, médias móveis e climáticas, numa única passada
+        # compilada (numba só é carregado aqui, não na importação do app)
+        from app.services.ml_kernels import features_vendas_kernel
+        features_numericas = features_vendas_kernel(
+            df['valor_total'].to_numpy(dtype=np.float64),
+            df['quantidade_itens'].to_numpy(dtype=np.float64),
+            df['temperatura'].to_numpy(dtype=np.float64),
+            df['umidade'].to_numpy(dtype=np.float64),
+            df['precipitacao_24h'].to_numpy(dtype=np.float64),
+            dia_semana
+        )
+        for j, coluna in enumerate(FEATURES_KERNEL_VENDAS):
+            X[:, indice[coluna]] = features_numericas[:, j]
         
-        X = df[feature_cols].values
-        y = df['valor_total'].values
+        # Features categóricas (one-hot) a partir dos códigos; nulos ficam zerados
+        X[:, inicio_dummies:] = 0
+        for coluna, deslocamento in (
+            ('categoria', inicio_dummies),
+            ('canal', inicio_dummies + len(categorias))
+        ):
+            codigos = df[coluna].cat.codes.to_numpy()
+            linhas = np.flatnonzero(codigos >= 0)
+            X[linhas, deslocamento + codigos[linhas]] = 1
+        
+        # Remove as linhas com NaN criados por lag e rolling
+        mascara = ~np.isnan(X).any(axis=1)
+        X = X[mascara]
+        y = df['valor_total'].to_numpy(dtype=np.float64)[mascara]
         
         return X, y, feature_cols
     
@@ -349,35 +519,83 @@ class MLService:
         modelo_nome: str
     ) -> Dict:
         """
-        Treina modelo de predição de vendas.
+        Treina modelo de predição de vendas (num processo do pool) e o salva.
         """
-        # Divide dados usando TimeSeriesSplit
-        tscv = TimeSeriesSplit(n_splits=5)
+        loop = asyncio.get_running_loop()
+        modelo_info = await loop.run_in_executor(
+            self.executor, MLService._ajustar_modelo_vendas, X, y, feature_names
+        )
         
-        # Normaliza features
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
+        # Salva no banco e disco
+        await self._salvar_modelo_db(modelo_nome, modelo_info)
         
-        # Treina modelo RandomForest
-        modelo = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=15,
-            min_samples_split=10,
-            min_samples_leaf=5,
-            random_state=42,
-            n_jobs=-1
-        )
+        return modelo_info
+    
+    @staticmethod
+    def _ajustar_modelo_vendas(
+        X: np.ndarray,
+        y: np.ndarray,
+        feature_names: List[str],
+        modelo_anterior: Optional[Dict] = None
+    ) -> Dict:
+        """
+        Ajusta o modelo de predição de vendas (CPU, sem acesso ao banco).
         
-        # Validação cruzada temporal
-        cv_scores = cross_val_score(
-            modelo, X_scaled, y, 
-            cv=tscv, 
-            scoring='r2',
-            n_jobs=-1
-        )
+        Com um modelo anterior compatível (mesmas features), continua o
+        treino via warm start em vez de refazer todas as árvores.
+        """
+        # Import aqui: o sklearn só é carregado quando há treino
+        from sklearn.ensemble import HistGradientBoostingRegressor
+        from sklearn.inspection import permutation_importance
+        from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+        from sklearn.model_selection import cross_val_score, TimeSeriesSplit
+        from sklearn.preprocessing import StandardScaler
         
-        # Treina modelo final
-        modelo.fit(X_scaled, y)
+        if MLService._pode_continuar_treino(modelo_anterior, feature_names):
+            # Mantém o scaler original: as árvores existentes foram ajustadas
+            # nessa escala
+            scaler = modelo_anterior['scaler']
+            X_scaled = scaler.transform(X).astype(np.float32, copy=False)
+            
+            modelo = modelo_anterior['model']
+            modelo_inferior = modelo_anterior['model_inferior']
+            modelo_superior = modelo_anterior['model_superior']
+            for estimador in (modelo, modelo_inferior, modelo_superior):
+                estimador.set_params(max_iter=estimador.max_iter + ITERACOES_RETREINO)
+                estimador.fit(X_scaled, y)
+            
+            # Sem refazer a validação cruzada: usa o R² da validação interna
+            cv_scores = np.asarray(modelo.validation_score_[-1:])
+        else:
+            # Divide dados usando TimeSeriesSplit
+            tscv = TimeSeriesSplit(n_splits=5)
+            
+            # Normaliza features (float32: metade da memória percorrida no treino)
+            scaler = StandardScaler()
+            X_scaled = scaler.fit_transform(X).astype(np.float32, copy=False)
+            
+            # Treina modelo de gradient boosting com features em histograma; o
+            # early stopping avalia R² na validação (reusado nas métricas)
+            modelo = HistGradientBoostingRegressor(scoring='r2', **HIPERPARAMETROS_VENDAS)
+            
+            # Validação cruzada temporal
+            cv_scores = cross_val_score(
+                modelo, X_scaled, y, 
+                cv=tscv, 
+                scoring='r2',
+                n_jobs=N_JOBS_WORKER
+            )
+            
+            # Treina modelo final
+            modelo.fit(X_scaled, y)
+            
+            # Modelos de quantis para o intervalo de confiança
+            modelo_inferior = HistGradientBoostingRegressor(
+                loss='quantile', quantile=QUANTIL_INFERIOR, **HIPERPARAMETROS_VENDAS
+            ).fit(X_scaled, y)
+            modelo_superior = HistGradientBoostingRegressor(
+                loss='quantile', quantile=QUANTIL_SUPERIOR, **HIPERPARAMETROS_VENDAS
+            ).fit(X_scaled, y)
         
         # Avalia modelo no conjunto de teste (últimos 20%)
         test_size = int(len(X) * 0.2)
@@ -388,8 +606,11 @@ class MLService:
         rmse = np.sqrt(mean_squared_error(y_test, y_pred))
         r2 = r2_score(y_test, y_pred)
         
-        # Feature importance
-        feature_importance = dict(zip(feature_names, modelo.feature_importances_))
+        # Feature importance (por permutação no conjunto de teste)
+        importancia = permutation_importance(
+            modelo, X_test, y_test, n_repeats=5, random_state=42, n_jobs=N_JOBS_WORKER
+        )
+        feature_importance = dict(zip(feature_names, importancia.importances_mean.tolist()))
         feature_importance = dict(sorted(
             feature_importance.items(), 
             key=lambda x: x[1], 
@@ -399,8 +620,11 @@ class MLService:
         # Salva modelo
         modelo_info = {
             'model': modelo,
+            'model_inferior': modelo_inferior,
+            'model_superior': modelo_superior,
             'scaler': scaler,
             'feature_names': feature_names,
+            'feature_index': {nome: i for i, nome in enumerate(feature_names)},
             'metrics': {
                 'mae': float(mae),
                 'rmse': float(rmse),
@@ -410,16 +634,35 @@ class MLService:
                 'cv_score_std': float(cv_scores.std())
             },
             'feature_importance': feature_importance,
-            'trained_at': datetime.now()
+            'trained_at': datetime.now(),
+            # Matriz de treino já normalizada, reaproveitada nas métricas
+            'X_scaled': X_scaled,
+            'y': y
         }
         
-        # Salva no banco e disco
-        await self._salvar_modelo_db(modelo_nome, modelo_info)
-        
         return modelo_info
     
-    async def _gerar_predicoes_vendas(
-        self,
+    @staticmethod
+    def _pode_continuar_treino(modelo_anterior: Optional[Dict], feature_names: List[str]) -> bool:
+        """
+        Verifica se o modelo anterior aceita warm start com as features atuais
+        e sem passar de MAX_ITER_WARM_START iterações.
+        """
+        from sklearn.ensemble import HistGradientBoostingRegressor
+        
+        if not modelo_anterior or 'model_inferior' not in modelo_anterior:
+            return False
+        
+        modelo = modelo_anterior.get('model')
+        return (
+            isinstance(modelo, HistGradientBoostingRegressor)
+            and modelo.warm_start
+            and modelo.max_iter + ITERACOES_RETREINO <= MAX_ITER_WARM_START
+            and list(modelo_anterior.get('feature_names', [])) == list(feature_names)
+        )
+    
+    @staticmethod
+    def _gerar_predicoes_vendas(
         modelo_info: Dict,
         data_inicio: datetime,
         data_fim: datetime,
@@ -429,139 +672,181 @@ class MLService:
         """
         Gera predições de vendas para o período especificado.
         """
+        from sklearn import config_context
+        
         modelo = modelo_info['model']
         scaler = modelo_info['scaler']
         feature_names = modelo_info['feature_names']
         
         # Prepara DataFrame para predições
         dates = pd.date_range(data_inicio, data_fim, freq='D')
-        predicoes = []
+        if len(dates) == 0:
+            return []
         
         # Última linha de dados históricos para features de lag
         ultimo_registro = df_historico.iloc[-1]
         
-        for date in dates:
-            # Cria features para a data
-            features = self._criar_features_predicao(
-                date, 
-                df_historico, 
-                ultimo_registro,
-                parametros
+        # Posição de cada feature na matriz, calculada uma vez por modelo
+        feature_index = modelo_info.get('feature_index')
+        if feature_index is None:
+            feature_index = {nome: i for i, nome in enumerate(feature_names)}
+            modelo_info['feature_index'] = feature_index
+        
+        # Estatísticas do histórico não mudam entre as datas: calculadas uma vez
+        estatisticas = MLService._estatisticas_historico(df_historico)
+        
+        # Monta a matriz de features de todos os dias de uma vez
+        # (features categóricas one-hot não marcadas ficam em 0)
+        X = np.zeros((len(dates), len(feature_names)), dtype=np.float64)
+        for date, out_row in zip(dates, X):
+            MLService._criar_features_predicao(
+                date, estatisticas, ultimo_registro, parametros, out_row, feature_index
             )
+        
+        # A matriz é montada aqui mesmo: dispensa a validação de valores
+        # finitos que o sklearn repete a cada transform/predict
+        with config_context(assume_finite=True):
+            # Normaliza e prediz todos os dias numa única chamada (float32, como no treino)
+            features_scaled = scaler.transform(X).astype(np.float32, copy=False)
+            valores_previstos = modelo.predict(features_scaled)
+            
+            # Segunda passada: o lag de 1 dia passa a ser a previsão do dia anterior
+            if len(dates) > 1 and 'vendas_lag_1' in feature_index:
+                X[1:, feature_index['vendas_lag_1']] = valores_previstos[:-1]
+                features_scaled = scaler.transform(X).astype(np.float32, copy=False)
+                valores_previstos = modelo.predict(features_scaled)
             
-            # Garante que temos todas as features necessárias
-            features_array = []
-            for fname in feature_names:
-                if fname in features:
-                    features_array.append(features[fname])
-                else:
-                    # Para features categóricas one-hot
-                    features_array.append(0)
-            
-            # Normaliza
-            features_scaled = scaler.transform([features_array])
-            
-            # Predição
-            valor_previsto = modelo.predict(features_scaled)[0]
-            
-            # Intervalo de confiança (usando árvores individuais)
-            if hasattr(modelo, 'estimators_'):
-                predictions = np.array([tree.predict(features_scaled)[0] for tree in modelo.estimators_])
-                intervalo_inferior = np.percentile(predictions, 5)
-                intervalo_superior = np.percentile(predictions, 95)
+            # Intervalo de confiança (modelos de quantis, ou árvores individuais
+            # em modelos RandomForest antigos)
+            if 'model_inferior' in modelo_info and 'model_superior' in modelo_info:
+                intervalos_inferiores = modelo_info['model_inferior'].predict(features_scaled)
+                intervalos_superiores = modelo_info['model_superior'].predict(features_scaled)
+            elif hasattr(modelo, 'estimators_'):
+                # Árvores preditas em threads (o predict libera o GIL e a matriz
+                # é compartilhada, sem cópia por worker)
+                predictions = np.stack(Parallel(n_jobs=-1, prefer='threads')(
+                    delayed(tree.predict)(features_scaled) for tree in modelo.estimators_
+                ))
+                intervalos_inferiores, intervalos_superiores = np.percentile(predictions, [5, 95], axis=0)
             else:
                 # Fallback simples
-                intervalo_inferior = valor_previsto * 0.9
-                intervalo_superior = valor_previsto * 1.1
-            
-            predicao = {
+                intervalos_inferiores = valores_previstos * 0.9
+                intervalos_superiores = valores_previstos * 1.1
+        
+        return [
+            {
                 'data': date.isoformat(),
                 'valor_previsto': round(float(valor_previsto), 2),
                 'intervalo_confianca_inferior': round(float(intervalo_inferior), 2),
                 'intervalo_confianca_superior': round(float(intervalo_superior), 2),
                 'dia_semana': date.strftime('%A'),
-                'features_utilizadas': features
+                'features_utilizadas': dict(zip(feature_names, features))
             }
-            
-            predicoes.append(predicao)
-            
-            # Atualiza último registro para próxima iteração (simula lag)
-            ultimo_registro = pd.Series({
-                'valor_total': valor_previsto,
-                'data_venda': date
-            })
+            for date, valor_previsto, intervalo_inferior, intervalo_superior, features in zip(
+                dates, valores_previstos, intervalos_inferiores, intervalos_superiores, X.tolist()
+            )
+        ]
+    
+    @staticmethod
+    def _estatisticas_historico(df_historico: pd.DataFrame) -> Dict:
+        """
+        Resume o histórico nos valores usados por _criar_features_predicao.
+        """
+        ultimos_7 = df_historico['valor_total'].tail(7)
+        ultimos_30 = df_historico['valor_total'].tail(30)
+        
+        # Climatologia mensal: médias de temperatura e umidade por mês
+        clima_mes = df_historico.groupby(
+            df_historico['data_venda'].dt.month
+        )[['temperatura', 'umidade']].mean()
         
-        return predicoes
+        return {
+            'media_7': float(ultimos_7.mean()),
+            'media_30': float(ultimos_30.mean()),
+            'desvio_7': float(ultimos_7.std()),
+            'desvio_30': float(ultimos_30.std()),
+            'temperatura_mes': clima_mes['temperatura'].to_dict(),
+            'umidade_mes': clima_mes['umidade'].to_dict(),
+            # Categoria e canal mais frequentes (para one-hot)
+            'categoria': df_historico['categoria'].mode()[0] if len(df_historico) > 0 else 'outros',
+            'canal': df_historico['canal'].mode()[0] if len(df_historico) > 0 else 'loja_fisica',
+        }
     
+    @staticmethod
     def _criar_features_predicao(
-        self,
         date: datetime,
-        df_historico: pd.DataFrame,
+        estatisticas: Dict,
         ultimo_registro: pd.Series,
-        parametros: Dict
-    ) -> Dict:
+        parametros: Dict,
+        out_row: np.ndarray,
+        feature_index: Dict[str, int]
+    ) -> None:
         """
-        Cria features para uma data específica de predição.
+        Preenche out_row com as features de uma data específica de predição.
+        
+        Features que o modelo não usa (ausentes em feature_index) são ignoradas.
         """
-        features = {}
+        def definir(nome: str, valor: float):
+            idx = feature_index.get(nome)
+            if idx is not None:
+                out_row[idx] = valor
         
         # Features temporais
-        features['dia_ano'] = date.timetuple().tm_yday
-        features['dia_mes'] = date.day
-        features['dia_semana'] = date.weekday()
-        features['mes'] = date.month
-        features['trimestre'] = (date.month - 1) // 3 + 1
-        features['is_fim_semana'] = 1 if date.weekday() >= 5 else 0
+        definir('dia_ano', date.timetuple().tm_yday)
+        definir('dia_mes', date.day)
+        definir('dia_semana', date.weekday())
+        definir('mes', date.month)
+        definir('trimestre', (date.month - 1) // 3 + 1)
+        definir('is_fim_semana', 1 if date.weekday() >= 5 else 0)
         
         # Verifica feriados (simplificado)
-        features['feriado'] = 0  # TODO: Implementar calendário de feriados
+        definir('feriado', 0)  # TODO: Implementar calendário de feriados
         
         # Features climáticas (usar previsão ou média histórica)
         if 'previsao_clima' in parametros:
             clima = parametros['previsao_clima'].get(date.date(), {})
-            features['temperatura'] = clima.get('temperatura', 25)
-            features['umidade'] = clima.get('umidade', 70)
-            features['precipitacao_24h'] = clima.get('precipitacao', 0)
-            features['vento_velocidade'] = clima.get('vento', 10)
+            temperatura = clima.get('temperatura', 25)
+            umidade = clima.get('umidade', 70)
+            precipitacao = clima.get('precipitacao', 0)
+            vento = clima.get('vento', 10)
         else:
             # Usa médias históricas para o mês
-            mes_historico = df_historico[df_historico['mes'] == date.month]
-            features['temperatura'] = mes_historico['temperatura'].mean() if len(mes_historico) > 0 else 25
-            features['umidade'] = mes_historico['umidade'].mean() if len(mes_historico) > 0 else 70
-            features['precipitacao_24h'] = 0
-            features['vento_velocidade'] = 10
+            temperatura = estatisticas['temperatura_mes'].get(date.month, 25)
+            umidade = estatisticas['umidade_mes'].get(date.month, 70)
+            precipitacao = 0
+            vento = 10
+        
+        definir('temperatura', temperatura)
+        definir('umidade', umidade)
+        definir('precipitacao_24h', precipitacao)
+        definir('vento_velocidade', vento)
         
         # Features derivadas
-        features['temp_squared'] = features['temperatura'] ** 2
-        features['temp_umidade_interaction'] = features['temperatura'] * features['umidade']
-        features['chuva_binary'] = 1 if features['precipitacao_24h'] > 0 else 0
+        definir('temp_squared', temperatura ** 2)
+        definir('temp_umidade_interaction', temperatura * umidade)
+        definir('chuva_binary', 1 if precipitacao > 0 else 0)
         
         # Lags (simplificado - usar últimos valores conhecidos)
-        features['vendas_lag_1'] = float(ultimo_registro['valor_total'])
-        features['vendas_lag_7'] = float(df_historico.tail(7)['valor_total'].mean())
-        features['vendas_lag_30'] = float(df_historico.tail(30)['valor_total'].mean())
+        definir('vendas_lag_1', float(ultimo_registro['valor_total']))
+        definir('vendas_lag_7', estatisticas['media_7'])
+        definir('vendas_lag_30', estatisticas['media_30'])
         
-        features['itens_lag_1'] = 50  # Valor padrão
-        features['itens_lag_7'] = 50
-        features['itens_lag_30'] = 50
+        definir('itens_lag_1', 50)  # Valor padrão
+        definir('itens_lag_7', 50)
+        definir('itens_lag_30', 50)
         
         # Médias móveis
-        features['media_movel_7'] = float(df_historico.tail(7)['valor_total'].mean())
-        features['media_movel_30'] = float(df_historico.tail(30)['valor_total'].mean())
-        features['desvio_movel_7'] = float(df_historico.tail(7)['valor_total'].std())
-        features['desvio_movel_30'] = float(df_historico.tail(30)['valor_total'].std())
+        definir('media_movel_7', estatisticas['media_7'])
+        definir('media_movel_30', estatisticas['media_30'])
+        definir('desvio_movel_7', estatisticas['desvio_7'])
+        definir('desvio_movel_30', estatisticas['desvio_30'])
         
-        # Categoria e canal mais frequentes (para one-hot)
-        categoria_mais_frequente = df_historico['categoria'].mode()[0] if len(df_historico) > 0 else 'outros'
-        canal_mais_frequente = df_historico['canal'].mode()[0] if len(df_historico) > 0 else 'loja_fisica'
-        
-        features[f'categoria_{categoria_mais_frequente}'] = 1
-        features[f'canal_{canal_mais_frequente}'] = 1
-        
-        return features
+        # Categoria e canal mais frequentes (one-hot)
+        definir(f"categoria_{estatisticas['categoria']}", 1)
+        definir(f"canal_{estatisticas['canal']}", 1)
     
+    @staticmethod
     def _calcular_metricas_confianca(
-        self,
         modelo: Any,
         X: np.ndarray,
         y: np.ndarray
@@ -569,15 +854,24 @@ class MLService:
         """
         Calcula métricas de confiança do modelo.
         """
-        # Cross-validation temporal
-        tscv = TimeSeriesSplit(n_splits=3)
-        
-        cv_scores = cross_val_score(
-            modelo, X, y, 
-            cv=tscv, 
-            scoring='r2', 
-            n_jobs=-1
-        )
+        if getattr(modelo, 'scoring', None) == 'r2' and len(getattr(modelo, 'validation_score_', [])) > 0:
+            # R² no conjunto de validação do early stopping, já calculado no treino
+            cv_scores = np.asarray(modelo.validation_score_[-1:])
+        elif getattr(modelo, 'oob_score_', None) is not None:
+            # RandomForest com out-of-bag
+            cv_scores = np.asarray([modelo.oob_score_])
+        else:
+            # Modelos antigos sem score guardado: cross-validation temporal
+            from sklearn.model_selection import cross_val_score, TimeSeriesSplit
+            
+            tscv = TimeSeriesSplit(n_splits=3)
+            
+            cv_scores = cross_val_score(
+                modelo, X, y, 
+                cv=tscv, 
+                scoring='r2', 
+                n_jobs=N_JOBS_WORKER
+            )
         
         # Calcula MAPE (Mean Absolute Percentage Error)
         y_pred = modelo.predict(X)
@@ -596,12 +890,22 @@ class MLService:
         Salva modelo no banco de dados e disco.
         """
         try:
-            # Salva arquivos
+            # Salva modelos, scaler e features num único arquivo. Sem
+            # compressão: arquivos comprimidos não podem ser mapeados da
+            # memória em _load_models
             modelo_path = os.path.join(settings.MODEL_PATH, f"{modelo_nome}_model.pkl")
-            scaler_path = os.path.join(settings.MODEL_PATH, f"{modelo_nome}_scaler.pkl")
             
-            joblib.dump(modelo_info['model'], modelo_path)
-            joblib.dump(modelo_info['scaler'], scaler_path)
+            joblib.dump(
+                {
+                    'model': modelo_info['model'],
+                    'model_inferior': modelo_info['model_inferior'],
+                    'model_superior': modelo_info['model_superior'],
+                    'scaler': modelo_info['scaler'],
+                    'feature_names': modelo_info['feature_names']
+                },
+                modelo_path,
+                protocol=pickle.HIGHEST_PROTOCOL
+            )
             
             with get_db_context() as db:
                 # Verifica se modelo já existe
@@ -614,22 +918,26 @@ class MLService:
                         nome=modelo_nome,
                         versao="1.0",
                         tipo="series_temporais",
-                        algoritmo="RandomForest",
+                        algoritmo="HistGradientBoosting",
                         descricao="Modelo de predição de vendas diárias"
                     )
                     db.add(modelo_db)
                 
+                # Scaler separado de versões anteriores não é mais usado
+                if modelo_db.caminho_scaler and os.path.exists(modelo_db.caminho_scaler):
+                    os.remove(modelo_db.caminho_scaler)
+                
                 # Atualiza informações
                 modelo_db.caminho_modelo = modelo_path
-                modelo_db.caminho_scaler = scaler_path
+                modelo_db.caminho_scaler = None
                 modelo_db.features_entrada = modelo_info['feature_names']
                 modelo_db.features_importancia = modelo_info['feature_importance']
                 modelo_db.metricas_treino = modelo_info['metrics']
+                modelo_db.algoritmo = "HistGradientBoosting"
                 modelo_db.hiperparametros = {
-                    'n_estimators': 100,
-                    'max_depth': 15,
-                    'min_samples_split': 10,
-                    'min_samples_leaf': 5
+                    **HIPERPARAMETROS_VENDAS,
+                    'max_iter': modelo_info['model'].max_iter,
+                    'quantis_intervalo': [QUANTIL_INFERIOR, QUANTIL_SUPERIOR]
                 }
                 modelo_db.ativo = True
                 modelo_db.em_producao = True
@@ -678,32 +986,57 @@ class MLService:
                 # Retreina todos os modelos
                 modelos_para_retreinar = list(self.models_cache.keys())
             
-            for modelo_nome in modelos_para_retreinar:
+            # Extrai user_id do nome do modelo
+            modelos_usuario = [
+                (modelo_nome, int(modelo_nome.split("user_")[1].split("_")[0]))
+                for modelo_nome in modelos_para_retreinar
+                if "user_" in modelo_nome
+            ]
+            if not modelos_usuario:
+                return
+            
+            # Prepara dados atualizados de todos os usuários
+            dfs_vendas = await asyncio.gather(*[
+                self._preparar_dados_vendas(user_id_modelo, {'meses_historico': 12})
+                for _, user_id_modelo in modelos_usuario
+            ])
+            
+            elegiveis = [
+                (modelo_nome, df_vendas)
+                for (modelo_nome, _), df_vendas in zip(modelos_usuario, dfs_vendas)
+                if len(df_vendas) >= settings.MIN_TRAINING_SAMPLES
+            ]
+            if not elegiveis:
+                return
+            
+            for modelo_nome, _ in elegiveis:
                 logger.info(f"Retreinando modelo {modelo_nome}")
+            
+            # Modelos atuais para continuar o treino (sem as matrizes de treino,
+            # que não precisam ir para os workers)
+            anteriores = [
+                _modelo_para_worker(self.models_cache.get(modelo_nome))
+                for modelo_nome, _ in elegiveis
+            ]
+            
+            # Treina os modelos em paralelo (um processo loky por modelo), sem
+            # bloquear o event loop enquanto aguarda
+            loop = asyncio.get_running_loop()
+            modelos_info = await loop.run_in_executor(
+                None,
+                lambda: Parallel(n_jobs=-1, backend='loky')(
+                    delayed(_ajustar_modelo_usuario)(df_vendas, anterior)
+                    for (_, df_vendas), anterior in zip(elegiveis, anteriores)
+                )
+            )
+            
+            for (modelo_nome, _), modelo_info in zip(elegiveis, modelos_info):
+                await self._salvar_modelo_db(modelo_nome, modelo_info)
                 
-                # Extrai user_id do nome do modelo
-                if "user_" in modelo_nome:
-                    user_id_modelo = int(modelo_nome.split("user_")[1].split("_")[0])
-                    
-                    # Prepara dados atualizados
-                    df_vendas = await self._preparar_dados_vendas(
-                        user_id_modelo,
-                        {'meses_historico': 12}
-                    )
-                    
-                    if len(df_vendas) >= settings.MIN_TRAINING_SAMPLES:
-                        # Prepara features
-                        X, y, feature_names = self._preparar_features_vendas(df_vendas)
-                        
-                        # Retreina
-                        modelo_info = await self._treinar_modelo_vendas(
-                            X, y, feature_names, modelo_nome
-                        )
-                        
-                        # Atualiza cache
-                        self.models_cache[modelo_nome] = modelo_info
-                        
-                        logger.info(f"Modelo {modelo_nome} retreinado com sucesso")
+                # Atualiza cache
+                self.models_cache[modelo_nome] = modelo_info
+                
+                logger.info(f"Modelo {modelo_nome} retreinado com sucesso")
                 
         except Exception as e:
             logger.error(f"Erro ao retreinar modelos: {e}")
@@ -744,6 +1077,10 @@ class MLService:
                 if df.empty:
                     return {'erro': 'Sem dados históricos para análise'}
                 
+                # Erros em float32: as reduções abaixo percorrem metade dos bytes
+                for coluna in ('erro_absoluto', 'erro_percentual'):
+                    df[coluna] = pd.to_numeric(df[coluna], downcast='float')
+                
                 # Calcula métricas
                 mae = df['erro_absoluto'].mean()
                 rmse = np.sqrt((df['erro_absoluto'] ** 2).mean())
@@ -763,7 +1100,7 @@ class MLService:
                         'rmse': float(rmse),
                         'mape': float(mape)
                     },
-                    'erro_por_dia_semana': erro_por_dia_semana.to_dict(),
+                    'erro_por_dia_semana': erro_por_dia_semana.astype(float).to_dict(),
                     'tendencia_erro': self._analisar_tendencia_erro(df)
                 }
                 
@@ -778,10 +1115,16 @@ class MLService:
         if len(df) < 10:
             return "Dados insuficientes"
         
-        # Divide em duas metades
-        meio = len(df) // 2
-        erro_primeira_metade = df.iloc[:meio]['erro_percentual'].abs().mean()
-        erro_segunda_metade = df.iloc[meio:]['erro_percentual'].abs().mean()
+        # Divide em duas metades e soma ambas numa única passada (reduceat);
+        # nulos ficam fora da soma e da contagem, como no mean do pandas
+        erros = np.abs(df['erro_percentual'].to_numpy(dtype=np.float32, na_value=np.nan))
+        validos = ~np.isnan(erros)
+        np.nan_to_num(erros, copy=False)
+        
+        limites = [0, erros.size // 2]
+        somas = np.add.reduceat(erros, limites)
+        contagens = np.add.reduceat(validos, limites, dtype=np.int64)
+        erro_primeira_metade, erro_segunda_metade = somas / contagens
         
         if erro_segunda_metade < erro_primeira_metade * 0.9:
             return "Melhorando"
@@ -790,5 +1133,60 @@ class MLService:
         else:
             return "Estável"
 
+def _treinar_e_prever_vendas(
+    df_vendas: pd.DataFrame,
+    modelo_info: Optional[Dict],
+    data_inicio: datetime,
+    data_fim: datetime,
+    parametros: Dict
+) -> Tuple[Optional[Dict], List[Dict], Dict]:
+    """
+    Etapa de CPU da predição de vendas diárias, executada no ProcessPoolExecutor
+    (função de módulo para ser importável pelos processos do pool).
+    
+    Returns:
+        (modelo treinado agora, ou None se o recebido foi usado; predições; métricas)
+    """
+    X, y, feature_names = MLService._preparar_features_vendas(df_vendas)
+    
+    treinado = modelo_info is None
+    if treinado:
+        modelo_info = MLService._ajustar_modelo_vendas(X, y, feature_names)
+    
+    predicoes = MLService._gerar_predicoes_vendas(
+        modelo_info,
+        data_inicio,
+        data_fim,
+        parametros,
+        df_vendas
+    )
+    
+    # Métricas sobre a matriz normalizada (a mesma escala vista pelo modelo);
+    # modelos carregados do disco não trazem a matriz em cache
+    if 'X_scaled' in modelo_info:
+        X_metricas, y_metricas = modelo_info['X_scaled'], modelo_info['y']
+    else:
+        X_metricas = modelo_info['scaler'].transform(X).astype(np.float32, copy=False)
+        y_metricas = y
+    
+    metricas = MLService._calcular_metricas_confianca(modelo_info['model'], X_metricas, y_metricas)
+    
+    # Só um modelo novo volta ao processo principal, e sem a matriz de treino
+    if not treinado:
+        return None, predicoes, metricas
+    
+    return _sem_matriz_treino(modelo_info), predicoes, metricas
+
+def _ajustar_modelo_usuario(df_vendas: pd.DataFrame, modelo_anterior: Optional[Dict] = None) -> Dict:
+    """
+    Prepara as features e ajusta o modelo de um usuário (worker do joblib
+    em retreinar_modelos), continuando o modelo anterior quando possível.
+    Volta ao processo principal sem a matriz de treino.
+    """
+    X, y, feature_names = MLService._preparar_features_vendas(df_vendas)
+    return _sem_matriz_treino(
+        MLService._ajustar_modelo_vendas(X, y, feature_names, modelo_anterior)
+    )
+
 # Instância global do serviço
 ml_service = MLService()
\ No newline at end of file
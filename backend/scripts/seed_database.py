@@ -4,33 +4,61 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from datetime import datetime, timedelta
+from datetime import datetime
 import random
+import numpy as np
+import pandas as pd
 from faker import Faker
+from sqlalchemy import insert
 from app.core.database import SessionLocal
 from app.models.user import User, UserRole
 from app.models.vendas import Venda, CategoriaVenda, CanalVenda
 from app.models.clima import EstacaoMeteorologica
 
+# Sementes fixas: o seed gera sempre os mesmos dados
+SEMENTE = 42
+
+Faker.seed(SEMENTE)
+random.seed(SEMENTE)
 fake = Faker('pt_BR')
+rng = np.random.default_rng(SEMENTE)
+
+# Linhas por chamada de bulk_insert_mappings (evita INSERTs gigantes)
+LOTE_INSERT = 10_000
+
+def inserir_em_lotes(db, modelo, rows):
+    """Insere dicionários em lotes, sem passar pelo unit of work do ORM."""
+    for inicio in range(0, len(rows), LOTE_INSERT):
+        db.bulk_insert_mappings(modelo, rows[inicio:inicio + LOTE_INSERT])
 
 def seed_users(db, count=10):
-    """Cria usuários de teste."""
-    users = []
-    for i in range(count):
-        user = User(
-            email=f"user{i}@example.com",
-            username=f"user{i}",
-            full_name=fake.name(),
-            hashed_password="$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW",  # secret
-            is_active=True,
-            is_verified=True,
-            role=random.choice([UserRole.USER, UserRole.VIEWER]),
-            company_name=fake.company(),
-            company_sector=random.choice(['Varejo', 'Serviços', 'Indústria', 'Agronegócio'])
-        )
-        db.add(user)
-        users.append(user)
+    """Cria usuários de teste (dicionários com o id gerado)."""
+    nomes = [fake.name() for _ in range(count)]
+    empresas = [fake.company() for _ in range(count)]
+    
+    users = [
+        {
+            "email": f"user{i}@example.com",
+            "username": f"user{i}",
+            "full_name": nomes[i],
+            "hashed_password": "$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW",  # secret
+            "is_active": True,
+            "is_verified": True,
+            "role": random.choice([UserRole.USER, UserRole.VIEWER]),
+            "company_name": empresas[i],
+            "company_sector": random.choice(['Varejo', 'Serviços', 'Indústria', 'Agronegócio'])
+        }
+        for i in range(count)
+    ]
+    
+    # Um único INSERT multi-VALUES; os ids voltam na ordem dos dicionários
+    # e são usados em seed_vendas
+    ids = db.scalars(
+        insert(User).returning(User.id, sort_by_parameter_order=True),
+        users
+    ).all()
+    for user, user_id in zip(users, ids):
+        user["id"] = user_id
     
     db.commit()
     return users
@@ -43,21 +71,21 @@ def seed_estacoes(db):
         {"codigo": "A803", "nome": "CAXIAS DO SUL", "lat": -29.16, "lon": -51.20, "cidade": "Caxias do Sul", "estado": "RS"},
     ]
     
-    estacoes = []
-    for data in estacoes_data:
-        estacao = EstacaoMeteorologica(
-            codigo_inmet=data["codigo"],
-            nome=data["nome"],
-            tipo="Automática",
-            latitude=data["lat"],
-            longitude=data["lon"],
-            cidade=data["cidade"],
-            estado=data["estado"],
-            ativa=True
-        )
-        db.add(estacao)
-        estacoes.append(estacao)
+    estacoes = [
+        {
+            "codigo_inmet": data["codigo"],
+            "nome": data["nome"],
+            "tipo": "Automática",
+            "latitude": data["lat"],
+            "longitude": data["lon"],
+            "cidade": data["cidade"],
+            "estado": data["estado"],
+            "ativa": True
+        }
+        for data in estacoes_data
+    ]
     
+    db.execute(insert(EstacaoMeteorologica), estacoes)
     db.commit()
     return estacoes
 
@@ -66,36 +94,69 @@ def seed_vendas(db, users, days=90):
     categorias = list(CategoriaVenda)
     canais = list(CanalVenda)
     
-    for user in users[:5]:  # Apenas primeiros 5 usuários
-        for d in range(days):
-            date = datetime.now() - timedelta(days=d)
-            
-            # 1-5 vendas por dia
-            for _ in range(random.randint(1, 5)):
-                valor = random.uniform(100, 5000)
-                itens = random.randint(1, 20)
-                
-                venda = Venda(
-                    user_id=user.id,
-                    data_venda=date,
-                    ano=date.year,
-                    mes=date.month,
-                    dia=date.day,
-                    dia_semana=date.weekday(),
-                    hora=random.randint(8, 20),
-                    valor_total=valor,
-                    quantidade_itens=itens,
-                    ticket_medio=valor/itens,
-                    categoria=random.choice(categorias),
-                    canal=random.choice(canais),
-                    cidade="Porto Alegre",
-                    estado="RS",
-                    temperatura=random.uniform(15, 35),
-                    umidade=random.uniform(40, 90),
-                    precipitacao=random.uniform(0, 50) if random.random() > 0.7 else 0
-                )
-                db.add(venda)
+    # Um dia por posição (hoje, ontem, ...), com as partes da data extraídas
+    # de uma vez do índice
+    datas = pd.date_range(start=datetime.now(), periods=days, freq='-1D')
+    datas_venda = datas.to_pydatetime().tolist()
+    anos = datas.year.tolist()
+    meses = datas.month.tolist()
+    dias = datas.day.tolist()
+    dias_semana = datas.dayofweek.tolist()
+    
+    user_ids = [user["id"] for user in users[:5]]  # Apenas primeiros 5 usuários
+    
+    # 1-5 vendas por dia para cada usuário; cada venda aponta para o seu
+    # usuário e dia
+    vendas_por_dia = rng.integers(1, 6, size=(len(user_ids), days)).ravel()
+    n = int(vendas_por_dia.sum())
+    idx_usuario = np.repeat(np.repeat(np.arange(len(user_ids)), days), vendas_por_dia)
+    idx_dia = np.repeat(np.tile(np.arange(days), len(user_ids)), vendas_por_dia)
+    
+    # Sorteia todas as vendas de uma vez
+    valor = rng.uniform(100, 5000, n)
+    itens = rng.integers(1, 21, n)
+    ticket = valor / itens
+    temperatura = rng.uniform(15, 35, n)
+    umidade = rng.uniform(40, 90, n)
+    precipitacao = np.where(rng.random(n) > 0.7, rng.uniform(0, 50, n), 0.0)
+    
+    # Enums e horas sorteados direto como listas, numa chamada cada
+    vendas_categoria = random.choices(categorias, k=n)
+    vendas_canal = random.choices(canais, k=n)
+    horas = random.choices(range(8, 21), k=n)
+    
+    # tolist() devolve escalares Python, aceitos pelo driver do banco
+    rows = [
+        {
+            "user_id": user_ids[u],
+            "data_venda": datas_venda[d],
+            "ano": anos[d],
+            "mes": meses[d],
+            "dia": dias[d],
+            "dia_semana": dias_semana[d],
+            "hora": h,
+            "valor_total": v,
+            "quantidade_itens": q,
+            "ticket_medio": t,
+            "categoria": c,
+            "canal": k,
+            "cidade": "Porto Alegre",
+            "estado": "RS",
+            "temperatura": temp,
+            "umidade": umid,
+            "precipitacao": prec
+        }
+        for u, d, h, v, q, t, c, k, temp, umid, prec in zip(
+            idx_usuario.tolist(), idx_dia.tolist(), horas, valor.tolist(),
+            itens.tolist(), ticket.tolist(), vendas_categoria, vendas_canal,
+            temperatura.tolist(), umidade.tolist(), precipitacao.tolist()
+        )
+    ]
+    
+    # Ordem dos índices (usuário, data): menos reescritas de páginas no insert
+    rows.sort(key=lambda r: (r["user_id"], r["data_venda"]))
     
+    inserir_em_lotes(db, Venda, rows)
     db.commit()
 
 def main():
@@ -1,17 +1,25 @@
+import os
+
+# One thread for Numba and one CPU for loky per test process: with
+# pytest-xdist (-n auto) every worker would otherwise grab all the cores.
+# Set before importing the app, since Numba reads it at import time
+os.environ.setdefault("NUMBA_NUM_THREADS", "1")
+os.environ.setdefault("LOKY_MAX_CPU_COUNT", "1")
+
 import pytest
 import asyncio
 from typing import Generator, AsyncGenerator
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, insert
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
 
 from app.main import app
 from app.core.database import Base, get_db
-from app.core.security import get_password_hash
+from app.core.security import get_password_hash, pwd_context
 from app.models.user import User, UserRole
 
-# Test database URL
+# Test database URL (in-memory, so already private to each pytest-xdist worker)
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
 
 # Create test engine
@@ -21,6 +29,34 @@ engine = create_engine(
     poolclass=StaticPool,
 )
 
+# Minimum bcrypt cost for the whole test session (set before any hashing);
+# test hashes never leave the test process
+pwd_context.update(bcrypt__rounds=4)
+
+# Test passwords are constants, so hash them once instead of per fixture
+_TEST_PW_HASH = get_password_hash("testpassword")
+_ADMIN_PW_HASH = get_password_hash("adminpassword")
+
+# pysqlite opens transactions on its own and breaks SAVEPOINT; let SQLAlchemy
+# emit BEGIN so the per-test transaction below can be nested
+@event.listens_for(engine, "connect")
+def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+@event.listens_for(engine, "begin")
+def _emit_begin(conn):
+    conn.exec_driver_sql("BEGIN")
+
+# The test database is throwaway: skip SQLite's durability work on commit
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA journal_mode=MEMORY")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
 # Create test session
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -31,20 +67,82 @@ def event_loop():
     yield loop
     loop.close()
 
-@pytest.fixture(scope="function")
-def db() -> Generator[Session, None, None]:
-    """Create a fresh database for each test."""
+# Baseline state of every test: these users are created once with the schema
+# and exist in all tests (per-test changes to them are rolled back). Tests
+# must not assume an empty users table.
+BASELINE_USERS = {
+    "user": {
+        "email": "test@example.com",
+        "username": "testuser",
+        "full_name": "Test User",
+        "hashed_password": _TEST_PW_HASH,
+        "is_active": True,
+        "is_verified": True,
+        "role": UserRole.USER
+    },
+    "admin": {
+        "email": "admin@example.com",
+        "username": "adminuser",
+        "full_name": "Admin User",
+        "hashed_password": _ADMIN_PW_HASH,
+        "is_active": True,
+        "is_verified": True,
+        "role": UserRole.ADMIN
+    }
+}
+
+# Rows of BASELINE_USERS as returned by the database, filled in by db_engine
+BASELINE_USER_ROWS: dict = {}
+
+@pytest.fixture(scope="session")
+def db_engine():
+    """
+    Create the database schema and the baseline users once, before any test
+    transaction starts.
+    
+    There is no drop_all: each test rolls back its transaction, and the
+    in-memory database goes away with the engine.
+    """
     Base.metadata.create_all(bind=engine)
-    db = TestingSessionLocal()
+    
+    # INSERT ... RETURNING gives the full rows without a refresh SELECT
+    with engine.begin() as connection:
+        rows = connection.execute(
+            insert(User).returning(*User.__table__.c, sort_by_parameter_order=True),
+            list(BASELINE_USERS.values())
+        ).all()
+    BASELINE_USER_ROWS.update(
+        (chave, dict(row._mapping)) for chave, row in zip(BASELINE_USERS, rows)
+    )
+    
+    return engine
+
+@pytest.fixture(scope="function")
+def db(db_engine) -> Generator[Session, None, None]:
+    """Run each test inside a transaction that is rolled back afterwards."""
+    connection = db_engine.connect()
+    transaction = connection.begin()
+    # commit() in fixtures and app code only releases a SAVEPOINT, so the
+    # outer transaction can still undo everything
+    db = TestingSessionLocal(bind=connection, join_transaction_mode="create_savepoint")
     try:
         yield db
     finally:
         db.close()
-        Base.metadata.drop_all(bind=engine)
+        transaction.rollback()
+        connection.close()
+
+@pytest.fixture(scope="session")
+def app_client() -> Generator[TestClient, None, None]:
+    """Create a test client, running the app startup/shutdown only once."""
+    with TestClient(app) as test_client:
+        yield test_client
+    
+    app.dependency_overrides.clear()
 
 @pytest.fixture(scope="function")
-def client(db: Session) -> Generator[TestClient, None, None]:
-    """Create a test client."""
+def client(app_client: TestClient, db: Session) -> TestClient:
+    """Get the test client bound to the current test's session."""
     def override_get_db():
         try:
             yield db
@@ -52,70 +150,63 @@ def client(db: Session) -> Generator[TestClient, None, None]:
             pass
     
     app.dependency_overrides[get_db] = override_get_db
-    
-    with TestClient(app) as test_client:
-        yield test_client
-    
-    app.dependency_overrides.clear()
+    return app_client
+
+@pytest.fixture(scope="session")
+def seeded_users(db_engine) -> dict:
+    """Get the ids of the baseline users."""
+    return {chave: row["id"] for chave, row in BASELINE_USER_ROWS.items()}
 
 @pytest.fixture
-def test_user(db: Session) -> User:
-    """Create a test user."""
-    user = User(
-        email="test@example.com",
-        username="testuser",
-        full_name="Test User",
-        hashed_password=get_password_hash("testpassword"),
-        is_active=True,
-        is_verified=True,
-        role=UserRole.USER
-    )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-    return user
+def test_user(db_engine) -> User:
+    """Get the test user, built from its RETURNING row (not attached to a session)."""
+    return User(**BASELINE_USER_ROWS["user"])
 
 @pytest.fixture
-def test_admin(db: Session) -> User:
-    """Create a test admin user."""
-    admin = User(
-        email="admin@example.com",
-        username="adminuser",
-        full_name="Admin User",
-        hashed_password=get_password_hash("adminpassword"),
-        is_active=True,
-        is_verified=True,
-        role=UserRole.ADMIN
-    )
-    db.add(admin)
-    db.commit()
-    db.refresh(admin)
-    return admin
+def test_admin(db_engine) -> User:
+    """Get the test admin user, built from its RETURNING row (not attached to a session)."""
+    return User(**BASELINE_USER_ROWS["admin"])
+
+def _login(test_client: TestClient, username: str, password: str) -> str:
+    """Log in through the API and return the access token."""
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+    
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        response = test_client.post(
+            "/api/v1/auth/login",
+            data={
+                "username": username,
+                "password": password
+            }
+        )
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+    
+    assert response.status_code == 200
+    return response.json()["access_token"]
+
+@pytest.fixture(scope="session")
+def auth_token(app_client: TestClient, seeded_users: dict) -> str:
+    """Log the test user in once per session."""
+    return _login(app_client, "test@example.com", "testpassword")
+
+@pytest.fixture(scope="session")
+def admin_token(app_client: TestClient, seeded_users: dict) -> str:
+    """Log the admin user in once per session."""
+    return _login(app_client, "admin@example.com", "adminpassword")
 
 @pytest.fixture
-def auth_headers(client: TestClient, test_user: User) -> dict:
+def auth_headers(auth_token: str) -> dict:
     """Get authentication headers for test user."""
-    response = client.post(
-        "/api/v1/auth/login",
-        data={
-            "username": test_user.email,
-            "password": "testpassword"
-        }
-    )
-    assert response.status_code == 200
-    token = response.json()["access_token"]
-    return {"Authorization": f"Bearer {token}"}
+    return {"Authorization": f"Bearer {auth_token}"}
 
 @pytest.fixture
-def admin_headers(client: TestClient, test_admin: User) -> dict:
+def admin_headers(admin_token: str) -> dict:
     """Get authentication headers for admin user."""
-    response = client.post(
-        "/api/v1/auth/login",
-        data={
-            "username": test_admin.email,
-            "password": "adminpassword"
-        }
-    )
-    assert response.status_code == 200
-    token = response.json()["access_token"]
-    return {"Authorization": f"Bearer {token}"}
\ No newline at end of file
+    return {"Authorization": f"Bearer {admin_token}"}
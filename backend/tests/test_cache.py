@@ -0,0 +1,126 @@
+import pytest
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from app.core.config import settings
+from app.services.cache_service import CacheService, cache_result, cache_service
+
+@pytest.fixture
+def cache_ativo(monkeypatch):
+    """Enable the cache decorator without a real Redis."""
+    monkeypatch.setattr(settings, "CACHE_ENABLED", True)
+    monkeypatch.setattr(cache_service, "redis_client", object())
+    monkeypatch.setattr(cache_service, "get", lambda key, deserialize=True: None)
+    monkeypatch.setattr(cache_service, "set_async_bg", lambda key, value, ttl=None: True)
+
+@pytest.mark.asyncio
+async def test_cache_result_waiter_cancelled(cache_ativo):
+    """Cancelling one waiter must not cancel the shared computation."""
+    liberar = asyncio.Event()
+    chamadas = 0
+    
+    @cache_result("teste:single_flight")
+    async def calcular(x):
+        nonlocal chamadas
+        chamadas += 1
+        await liberar.wait()
+        return x * 2
+    
+    dono = asyncio.create_task(calcular(21))
+    await asyncio.sleep(0)
+    cancelado = asyncio.create_task(calcular(21))
+    esperando = asyncio.create_task(calcular(21))
+    await asyncio.sleep(0)
+    
+    cancelado.cancel()
+    await asyncio.sleep(0)
+    liberar.set()
+    
+    assert await dono == 42
+    assert await esperando == 42
+    with pytest.raises(asyncio.CancelledError):
+        await cancelado
+    assert chamadas == 1
+
+def test_serialize_roundtrip_int_keys():
+    """Values with non-str dict keys must survive the msgpack round trip."""
+    valor = {1: "janeiro", 2: {"total": 10.5}, "datas": [date(2024, 1, 1), datetime(2024, 1, 1, 12)]}
+    
+    assert CacheService._deserialize(CacheService._serialize(valor)) == valor
+
+def test_generate_key_distinguishes_numeric_types():
+    """1, 1.0 and True must not share a memoized cache key."""
+    chaves = {
+        cache_service._generate_key("teste:chave", {"x": valor})
+        for valor in (1, 1.0, True)
+    }
+    
+    assert len(chaves) == 3
+
+def test_unserializable_value_is_not_cached(monkeypatch):
+    """A value pickle cannot handle is skipped instead of raising."""
+    monkeypatch.setattr(cache_service, "redis_client", object())
+    valor = lambda: None
+    
+    assert cache_service.set("teste:serializacao", valor) is False
+    assert cache_service.get_or_set("teste:serializacao", valor, 60) is valor
+
+@pytest.mark.asyncio
+async def test_fechar_flushes_pending_writes(monkeypatch):
+    """Writes still queued at shutdown must reach Redis."""
+    gravados = {}
+    
+    class PipelineFalso:
+        def setex(self, key, ttl, value):
+            gravados[key] = value
+        
+        def set(self, key, value):
+            gravados[key] = value
+        
+        def execute(self):
+            pass
+    
+    class RedisFalso:
+        def pipeline(self, transaction=True):
+            return PipelineFalso()
+    
+    monkeypatch.setattr(cache_service, "redis_client", RedisFalso())
+    for i in range(3):
+        assert cache_service.set_async_bg(f"teste:fechar:{i}", i, 60)
+    
+    await cache_service.fechar()
+    
+    assert sorted(CacheService._deserialize(v) for v in gravados.values()) == [0, 1, 2]
+
+def test_generate_key_unhashable_param():
+    """Params that are unhashable or not JSON-serializable still get a stable key."""
+    class Filtro:
+        def __repr__(self):
+            return "Filtro(sul)"
+    
+    params = {"estados": {"RS"}, "filtro": Filtro()}
+    
+    assert cache_service._generate_key("teste:chave", params) == cache_service._generate_key("teste:chave", params)
+
+def test_cache_result_separate_event_loops(cache_ativo):
+    """The same key computed on another event loop must not await a foreign future."""
+    iniciou = threading.Event()
+    liberar = threading.Event()
+    
+    @cache_result("teste:loops")
+    async def calcular(x):
+        if threading.current_thread() is not threading.main_thread():
+            iniciou.set()
+            await asyncio.to_thread(liberar.wait)
+        return x * 2
+    
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        outro_loop = executor.submit(asyncio.run, calcular(21))
+        assert iniciou.wait(5)
+        try:
+            assert asyncio.run(calcular(21)) == 42
+        finally:
+            liberar.set()
+        assert outro_loop.result(5) == 42
@@ -0,0 +1,23 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+@pytest.mark.parametrize("modulo", ["sklearn", "numba"])
+def test_app_import_does_not_load_heavy_module(modulo):
+    """Importing the app must not pull in scikit-learn or numba."""
+    # Fresh interpreter: other tests may already have imported them
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys, app.main; assert {modulo!r} not in sys.modules, '{modulo} importado'"
+        ],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True
+    )
+    assert result.returncode == 0, result.stderr